@@ -8,10 +8,19 @@ PO Box 1866, Mountain View, CA 94042, USA.
 
 from __future__ import print_function
 
+import array
+import bisect
 import csv
 
 import ipaddress
 
+import disnetperf.AUX_packed_index as pi
+
+
+# global vars - begin
+loadedIndexes = {}  # keys: CSV-filenames; values: tuples (<IPtoASIndex>, <signature of the file it was built from>)
+# global vars - end
+
 
 def IPToInt(ip):
     """
@@ -22,46 +31,124 @@ def IPToInt(ip):
     return int(ipaddress.ip_address(ip))
 
 
-def mapIPtoAS(IPListArg, IPtoASFilename, verbose):
+class IPtoASIndex:
     """
-    Returns a dictionary containing the IP-to-AS mappings
-    :param IPList:          list containing the IPs to be analysed
+    This class represents a compiled IP-to-AS index: sorted lower and upper bounds of the IP ranges and, for each range,
+    the position of its AS in an interned ASN table. The bound arrays are memory-mapped from disk (or held in memory if
+    the index file could not be written)
+    """
+    def __init__(self, sections):
+        """
+        Initializes the object's attributes
+        :param sections:    the sections of the index file, as returned by AUX_packed_index.loadIndex
+        """
+        self.lowerBounds = sections['lower']
+        self.upperBounds = sections['upper']
+        self.ASIndices = sections['as']
+        self.ASTable = sections['astable']
+
+    def lookup(self, ip):
+        """
+        Returns the AS the IP <ip> is located in
+        :param ip:  a representation of an IP address (for instance, a string)
+        :return:    the ASN (string) or 'NA_MAP' if <ip> does not belong to any range of the index
+        """
+        IP = IPToInt(ip)
+        idx = bisect.bisect_right(self.lowerBounds, IP) - 1
+        if idx >= 0 and IP <= self.upperBounds[idx]:
+            return self.ASTable[self.ASIndices[idx]]
+        return 'NA_MAP'
+
+
+def buildIPtoASIndex(IPtoASFilename, indexFilename):
+    """
+    Compiles the CSV-file <IPtoASFilename> into the index file <indexFilename>. This has to be done only once; the
+    index is rebuilt automatically by loadIPtoASIndex when the CSV-file changes
     :param IPtoASFilename:  CSV-file containing IP-to-AS mappings (IPs given in ranges).
                             Line-format: <IP lower bound> <IP upper bound> <AS>
-    :param verbose:         if true, an error-message gets displayed when an internal problem occurs; otherwise not
-    :return:                a dictionary with an IP as key and the corresponding AS as value
+    :param indexFilename:   name of the index file to create
+    :return:                the sections of the index (see AUX_packed_index.storeIndex); None if a problem occurred
     """
-    IPtoASMap = {}
+    signature = pi.sourceSignature([IPtoASFilename])
+    if signature is None:
+        return None
 
+    ranges = []
     try:
         with open(IPtoASFilename, 'r') as csvfile:
-            reader = csv.reader(csvfile)
-            IPRangeData = list(reader)
-    except IOError:
+            for mapping in csv.reader(csvfile):
+                if len(mapping) < 3 or not mapping[2].split():
+                    continue
+                ranges.append((int(mapping[0]), int(mapping[1]), mapping[2].split()[0][2:]))
+    except (IOError, ValueError):
+        return None
+    ranges.sort()
+
+    lowerBounds = array.array('I')
+    upperBounds = array.array('I')
+    ASIndices = array.array('I')
+    ASTable = []
+    ASToIdx = {}
+
+    for lowerbound, upperbound, AS in ranges:
+        if AS not in ASToIdx:
+            ASToIdx[AS] = len(ASTable)
+            ASTable.append(AS)
+        lowerBounds.append(lowerbound)
+        upperBounds.append(upperbound)
+        ASIndices.append(ASToIdx[AS])
+
+    return pi.storeIndex(indexFilename, signature, {'lower': lowerBounds, 'upper': upperBounds, 'as': ASIndices},
+                         {'astable': ASTable})
+
+
+def loadIPtoASIndex(IPtoASFilename, verbose):
+    """
+    Returns the compiled index for <IPtoASFilename>, (re)building it if it is missing or out of date.
+    The index is stored next to the CSV-file, with the extension '.idx'
+    :param IPtoASFilename:  CSV-file containing IP-to-AS mappings
+    :param verbose:         if true, an error-message gets displayed when an internal problem occurs; otherwise not
+    :return:                an IPtoASIndex object; None if a problem occurred
+    """
+    signature = pi.sourceSignature([IPtoASFilename])
+    if signature is None:
         if verbose:
             print("error: Could not open '" + IPtoASFilename + "'\n")
         return None
 
-    IPList = list(IPListArg)
-    IPList.sort(key=IPToInt)
+    if IPtoASFilename in loadedIndexes:
+        index, indexSignature = loadedIndexes[IPtoASFilename]
+        if indexSignature == signature:
+            return index
 
-    currentIndex = 0
-    nbOfMappings = len(IPRangeData)
+    indexFilename = IPtoASFilename + '.idx'
+    sections = pi.loadIndex(indexFilename, signature)
+    if sections is None:
+        sections = buildIPtoASIndex(IPtoASFilename, indexFilename)
+        if sections is None:
+            if verbose:
+                print("error: Could not build index '" + indexFilename + "'\n")
+            return None
 
-    for ip in IPList:
-        IP = IPToInt(ip)
+    loadedIndexes[IPtoASFilename] = (IPtoASIndex(sections), signature)
+    return loadedIndexes[IPtoASFilename][0]
+
+
+def mapIPtoAS(IPListArg, IPtoASFilename, verbose):
+    """
+    Returns a dictionary containing the IP-to-AS mappings
+    :param IPList:          list containing the IPs to be analysed
+    :param IPtoASFilename:  CSV-file containing IP-to-AS mappings (IPs given in ranges).
+                            Line-format: <IP lower bound> <IP upper bound> <AS>
+    :param verbose:         if true, an error-message gets displayed when an internal problem occurs; otherwise not
+    :return:                a dictionary with an IP as key and the corresponding AS as value
+    """
+    index = loadIPtoASIndex(IPtoASFilename, verbose)
+    if index is None:
+        return None
+
+    IPtoASMap = {}
+    for ip in IPListArg:
+        IPtoASMap[ip] = index.lookup(ip)
 
-        while currentIndex < nbOfMappings:
-            mapping = IPRangeData[currentIndex]
-            lowerbound, upperbound = int(mapping[0]), int(mapping[1])
-            if IP >= lowerbound and IP <= upperbound:
-                ASdata = mapping[2].split()
-                IPtoASMap[ip] = ASdata[0][2:]
-                break
-            elif lowerbound > IP:  # no match found!
-                IPtoASMap[ip] = 'NA_MAP'
-                break
-            else:
-                currentIndex += 1
-
-    return IPtoASMap
\ No newline at end of file
+    return IPtoASMap
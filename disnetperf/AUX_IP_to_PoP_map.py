@@ -0,0 +1,174 @@
+# Author: Sarah Wassermann <sarah@wassermann.lu>
+
+"""
+This work is licensed under the Creative Commons Attribution-NoDerivatives 4.0 International License.
+To view a copy of this license, visit http://creativecommons.org/licenses/by-nd/4.0/ or send a letter to Creative Commons,
+PO Box 1866, Mountain View, CA 94042, USA.
+"""
+
+from __future__ import print_function
+
+import array
+import bisect
+import socket
+import struct
+
+import disnetperf.AUX_packed_index as pi
+
+
+# global vars - begin
+# when an IP is not in the mapping, the PoP of the longest of these prefixes covering it is used, provided that all the
+# mapped IPs of the prefix are located in the same PoP
+FALLBACK_PREFIX_LENGTHS = (24, 20, 16)
+
+loadedIndexes = {}  # keys: mapping-filenames; values: tuples (<IPtoPoPIndex>, <signature of the file it was built from>)
+# global vars - end
+
+
+def IPv4ToInt(ip):
+    """
+    Returns the integer corresponding to the IPv4 address <ip> (string in the format X.X.X.X)
+    :return:    the integer; None if <ip> is not an IPv4 address
+    """
+    if ip.count('.') != 3:
+        return None
+    try:
+        return struct.unpack('!I', socket.inet_aton(ip))[0]
+    except (socket.error, ValueError):
+        return None
+
+
+def intToIPv4(IP):
+    """
+    Returns the IPv4 address (string in the format X.X.X.X) corresponding to the integer <IP>
+    """
+    return socket.inet_ntoa(struct.pack('!I', IP))
+
+
+def prefixMask(length):
+    """
+    Returns the mask of an IPv4-prefix of length <length>, as an integer
+    """
+    return (0xFFFFFFFF << (32 - length)) & 0xFFFFFFFF
+
+
+class IPtoPoPIndex:
+    """
+    This class represents a compiled IP-to-PoP index: the sorted mapped IPv4 addresses (as integers) and, for each of
+    them, the position of its PoP in an interned PoP table, as well as the same arrays for the prefixes used as
+    fallback. The arrays are memory-mapped from disk (or held in memory if the index file could not be written)
+    """
+    def __init__(self, sections):
+        """
+        Initializes the object's attributes
+        :param sections:    the sections of the index, as returned by AUX_packed_index.loadIndex or storeIndex
+        """
+        self.addresses = sections['addresses']
+        self.PoPIndices = sections['pops']
+        self.PoPTable = sections['poptable']
+        self.prefixes = [(prefixMask(length), sections['prefixes' + str(length)], sections['prefixpops' + str(length)])
+                         for length in FALLBACK_PREFIX_LENGTHS]
+
+    def lookup(self, ip):
+        """
+        Returns the PoP the IP <ip> is located in
+        :param ip:  a representation of an IP address (for instance, a string)
+        :return:    the PoP-ID (string) or 'NA' if neither <ip> nor one of its prefixes is mapped
+        """
+        IP = IPv4ToInt(ip)
+        if IP is None:
+            return 'NA'
+
+        idx = bisect.bisect_left(self.addresses, IP)
+        if idx < len(self.addresses) and self.addresses[idx] == IP:
+            return self.PoPTable[self.PoPIndices[idx]]
+
+        for mask, prefixes, PoPIndices in self.prefixes:  # from the longest to the shortest prefix
+            prefix = IP & mask
+            idx = bisect.bisect_left(prefixes, prefix)
+            if idx < len(prefixes) and prefixes[idx] == prefix:
+                return self.PoPTable[PoPIndices[idx]]
+        return 'NA'
+
+
+def buildIPtoPoPIndex(IPtoPoPFilename, indexFilename):
+    """
+    Compiles the mapping file <IPtoPoPFilename> into the index file <indexFilename>. This has to be done only once;
+    the index is rebuilt automatically by loadIPtoPoPIndex when the mapping file changes
+    :param IPtoPoPFilename: file containing IP-to-PoP mappings, as provided by the iPlane project.
+                            Line-format: <IP> <PoP>
+    :param indexFilename:   name of the index file to create
+    :return:                the sections of the index (see AUX_packed_index.storeIndex); None if a problem occurred
+    """
+    signature = pi.sourceSignature([IPtoPoPFilename])
+    if signature is None:
+        return None
+
+    PoPTable = []
+    PoPToIdx = {}
+    mapping = {}
+    try:
+        with open(IPtoPoPFilename, 'r') as PoPFile:
+            for line in PoPFile:
+                pair = line.split()
+                if len(pair) < 2:
+                    continue
+                IP = IPv4ToInt(pair[0])
+                if IP is None:
+                    continue
+                if pair[1] not in PoPToIdx:
+                    PoPToIdx[pair[1]] = len(PoPTable)
+                    PoPTable.append(pair[1])
+                mapping[IP] = PoPToIdx[pair[1]]
+    except IOError:
+        return None
+
+    arrays = {'addresses': array.array('I', sorted(mapping)), 'pops': array.array('I')}
+    for IP in arrays['addresses']:
+        arrays['pops'].append(mapping[IP])
+
+    # a prefix is only kept if all its mapped IPs are located in the same PoP
+    for length in FALLBACK_PREFIX_LENGTHS:
+        mask = prefixMask(length)
+        prefixPoPs = {}
+        for IP in arrays['addresses']:
+            prefix = IP & mask
+            PoP = prefixPoPs.get(prefix, mapping[IP])
+            prefixPoPs[prefix] = PoP if PoP == mapping[IP] else -1
+        prefixes = sorted(prefix for prefix in prefixPoPs if prefixPoPs[prefix] != -1)
+        arrays['prefixes' + str(length)] = array.array('I', prefixes)
+        arrays['prefixpops' + str(length)] = array.array('I', [prefixPoPs[prefix] for prefix in prefixes])
+
+    return pi.storeIndex(indexFilename, signature, arrays, {'poptable': PoPTable})
+
+
+def loadIPtoPoPIndex(IPtoPoPFilename, verbose):
+    """
+    Returns the compiled index for <IPtoPoPFilename>, (re)building it if it is missing or out of date.
+    The index is stored next to the mapping file, with the extension '.idx'
+    :param IPtoPoPFilename: file containing IP-to-PoP mappings
+    :param verbose:         if true, an error-message gets displayed when an internal problem occurs; otherwise not
+    :return:                an IPtoPoPIndex object; None if a problem occurred
+    """
+    signature = pi.sourceSignature([IPtoPoPFilename])
+    if signature is None:
+        if verbose:
+            print("error: Could not open '" + IPtoPoPFilename + "'\n")
+        return None
+
+    if IPtoPoPFilename in loadedIndexes:
+        index, indexSignature = loadedIndexes[IPtoPoPFilename]
+        if indexSignature == signature:
+            return index
+
+    indexFilename = IPtoPoPFilename + '.idx'
+    sections = pi.loadIndex(indexFilename, signature)
+    if sections is None:
+        sections = buildIPtoPoPIndex(IPtoPoPFilename, indexFilename)
+        if sections is None:
+            if verbose:
+                print("error: Could not build index '" + indexFilename + "'\n")
+            return None
+
+    loadedIndexes[IPtoPoPFilename] = (IPtoPoPIndex(sections), signature)
+    return loadedIndexes[IPtoPoPFilename][0]
@@ -0,0 +1,139 @@
+# Author: Sarah Wassermann <sarah@wassermann.lu>
+
+"""
+This work is licensed under the Creative Commons Attribution-NoDerivatives 4.0 International License.
+To view a copy of this license, visit http://creativecommons.org/licenses/by-nd/4.0/ or send a letter to Creative Commons,
+PO Box 1866, Mountain View, CA 94042, USA.
+"""
+
+from __future__ import print_function
+
+import array
+import bisect
+
+import disnetperf.AUX_IP_to_PoP_map as parsePoP
+import disnetperf.AUX_packed_index as pi
+
+
+# global vars - begin
+loadedIndexes = {}  # keys: alias-list filenames; values: tuples (<AliasIndex>, <signature of the file it was built from>)
+# global vars - end
+
+
+class AliasIndex:
+    """
+    This class represents a compiled alias index: the sorted IPv4 addresses (as integers) of the interfaces listed in
+    the alias lists and, for each of them, the ID of its router. A router is identified by its smallest interface
+    address, stored in a string table. The arrays are memory-mapped from disk (or held in memory if the index file could
+    not be written)
+    """
+    def __init__(self, sections):
+        """
+        Initializes the object's attributes
+        :param sections:    the sections of the index, as returned by AUX_packed_index.loadIndex or storeIndex
+        """
+        self.addresses = sections['addresses']
+        self.routerIDs = sections['routers']
+        self.routerTable = sections['routertable']
+
+    def router(self, ip):
+        """
+        Returns the router the interface <ip> belongs to
+        :param ip:  an IPv4 address (string in the format X.X.X.X)
+        :return:    the smallest interface address of the router; <ip> itself if it is not listed in the alias lists
+        """
+        IP = parsePoP.IPv4ToInt(ip)
+        if IP is None:
+            return ip
+
+        idx = bisect.bisect_left(self.addresses, IP)
+        if idx < len(self.addresses) and self.addresses[idx] == IP:
+            return self.routerTable[self.routerIDs[idx]]
+        return ip
+
+
+def findRoot(parents, IP):
+    """
+    Returns the root of the set <IP> belongs to in the union-find forest <parents>, compressing the path on the way
+    """
+    root = IP
+    while parents[root] != root:
+        root = parents[root]
+    while parents[IP] != root:
+        parents[IP], IP = root, parents[IP]
+    return root
+
+
+def buildAliasIndex(aliasFilename, indexFilename):
+    """
+    Compiles the alias lists <aliasFilename> into the index file <indexFilename>. Alias sets sharing an interface are
+    merged (union-find). This has to be done only once; the index is rebuilt automatically by loadAliasIndex when the
+    alias lists change
+    :param aliasFilename:   file containing one alias set per line, i.e. the space-separated interface addresses of a
+                            router
+    :param indexFilename:   name of the index file to create
+    :return:                the sections of the index (see AUX_packed_index.storeIndex); None if a problem occurred
+    """
+    signature = pi.sourceSignature([aliasFilename])
+    if signature is None:
+        return None
+
+    parents = {}
+    try:
+        with open(aliasFilename, 'r') as aliasFile:
+            for line in aliasFile:
+                IPs = [IP for IP in map(parsePoP.IPv4ToInt, line.split()) if IP is not None]
+                for IP in IPs:
+                    parents.setdefault(IP, IP)
+                for IP in IPs[1:]:
+                    rootA, rootB = findRoot(parents, IPs[0]), findRoot(parents, IP)
+                    if rootA != rootB:
+                        parents[max(rootA, rootB)] = min(rootA, rootB)  # the root is the smallest address
+    except IOError:
+        return None
+
+    addresses = array.array('I', sorted(parents))
+    routerIDs = array.array('I')
+    routerTable = []
+    rootToID = {}
+    for IP in addresses:
+        root = findRoot(parents, IP)
+        if root not in rootToID:
+            rootToID[root] = len(routerTable)
+            routerTable.append(parsePoP.intToIPv4(root))
+        routerIDs.append(rootToID[root])
+
+    return pi.storeIndex(indexFilename, signature, {'addresses': addresses, 'routers': routerIDs},
+                         {'routertable': routerTable})
+
+
+def loadAliasIndex(aliasFilename, verbose):
+    """
+    Returns the compiled index for <aliasFilename>, (re)building it if it is missing or out of date.
+    The index is stored next to the alias lists, with the extension '.idx'
+    :param aliasFilename:   file containing the alias lists
+    :param verbose:         if true, an error-message gets displayed when an internal problem occurs; otherwise not
+    :return:                an AliasIndex object; None if a problem occurred
+    """
+    signature = pi.sourceSignature([aliasFilename])
+    if signature is None:
+        if verbose:
+            print("error: Could not open '" + aliasFilename + "'\n")
+        return None
+
+    if aliasFilename in loadedIndexes:
+        index, indexSignature = loadedIndexes[aliasFilename]
+        if indexSignature == signature:
+            return index
+
+    indexFilename = aliasFilename + '.idx'
+    sections = pi.loadIndex(indexFilename, signature)
+    if sections is None:
+        sections = buildAliasIndex(aliasFilename, indexFilename)
+        if sections is None:
+            if verbose:
+                print("error: Could not build index '" + indexFilename + "'\n")
+            return None
+
+    loadedIndexes[aliasFilename] = (AliasIndex(sections), signature)
+    return loadedIndexes[aliasFilename][0]
@@ -0,0 +1,200 @@
+# Author: Sarah Wassermann <sarah@wassermann.lu>
+
+"""
+This work is licensed under the Creative Commons Attribution-NoDerivatives 4.0 International License.
+To view a copy of this license, visit http://creativecommons.org/licenses/by-nd/4.0/ or send a letter to Creative Commons,
+PO Box 1866, Mountain View, CA 94042, USA.
+"""
+
+import threading
+import time
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import h2  # optional; only needed for HTTP/2, through httpx
+    import httpx
+except ImportError:
+    httpx = None
+
+import disnetperf.AUX_request_scheduler as rs
+
+
+# global vars - begin
+ATLAS_API_URL = 'https://atlas.ripe.net/api/v2/'
+REQUEST_TIMEOUT = 60            # timeout (in seconds) of a single HTTP request
+NB_TIMINGS_KEPT = 10000         # number of per-call timings kept in memory
+
+session = None                  # the HTTP session shared by all the requests (see getSession)
+sessionPoolSize = None          # the number of connections of <session>
+sessionErrors = (requests.RequestException,)
+sessionLock = threading.Lock()
+useHTTP2 = False
+
+# each entry is a tuple (<method>, <path>, <HTTP status; None if no response>, <duration in seconds>)
+timings = deque(maxlen=NB_TIMINGS_KEPT)
+# global vars - end
+
+
+def configureClient(http2=False):
+    """
+    Selects the HTTP stack used for the following requests: HTTP/1.1 keep-alive connections, or HTTP/2 (this requires
+    the 'httpx' package with its 'http2' extra)
+    :param http2:   if true, the requests are sent over HTTP/2
+    :return:        True if the HTTP stack has been selected; None if a problem occurred
+    """
+    global session, sessionErrors, useHTTP2
+    if http2 and httpx is None:
+        print("error: The 'httpx' package (with its 'http2' extra) is required to send the requests over HTTP/2!\n")
+        return None
+
+    with sessionLock:
+        useHTTP2 = bool(http2)
+        session = None
+        sessionErrors = (httpx.HTTPError,) if useHTTP2 else (requests.RequestException,)
+    return True
+
+
+def getSession():
+    """
+    Returns the HTTP session shared by all the requests. Its connections are kept alive and pooled, so that the
+    TLS handshake is only done once per connection instead of once per request. The pool holds as many connections as
+    the shared request scheduler lets requests be in flight; the session is recreated if this number changes
+    """
+    global session, sessionPoolSize
+    poolSize = rs.getScheduler().maxConcurrency
+    with sessionLock:
+        if session is None or sessionPoolSize != poolSize:
+            if useHTTP2:
+                session = httpx.Client(http2=True, timeout=REQUEST_TIMEOUT,
+                                       limits=httpx.Limits(max_connections=poolSize))
+            else:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=poolSize)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+            sessionPoolSize = poolSize
+        return session
+
+
+def request(method, path, params=None, payload=None, key=None):
+    """
+    Sends a request to the RIPE Atlas API through the shared session and records its duration in <timings>
+    :param method:  the HTTP method ('GET' or 'POST')
+    :param path:    the path of the endpoint, relative to ATLAS_API_URL (or a full URL)
+    :param params:  a dictionary of query parameters
+    :param payload: the JSON body of the request
+    :param key:     the API key to use, if any
+    :return:        a tuple (<is_success>, <response>) where <response> is the decoded JSON response. On failure,
+                    <response> has the form {'error': {'status': <HTTP status>, 'detail': <message>,
+                    'retry_after': <seconds>}}
+    """
+    url = path if path.startswith('http') else ATLAS_API_URL + path
+    headers = {'Accept': 'application/json'}
+    if key:
+        headers['Authorization'] = 'Key ' + key
+
+    begin = time.time()
+    try:
+        response = getSession().request(method, url, params=params, json=payload, headers=headers,
+                                        timeout=REQUEST_TIMEOUT)
+    except sessionErrors as e:
+        timings.append((method, path, None, time.time() - begin))
+        return False, {'error': {'status': None, 'detail': str(e)}}
+    timings.append((method, path, response.status_code, time.time() - begin))
+
+    if 200 <= response.status_code < 300:
+        try:
+            return True, response.json()
+        except ValueError:
+            return False, {'error': {'status': response.status_code, 'detail': 'invalid JSON response'}}
+
+    retryAfter = response.headers.get('Retry-After')
+    return False, {'error': {'status': response.status_code, 'detail': response.text,
+                             'retry_after': float(retryAfter) if retryAfter and retryAfter.isdigit() else None}}
+
+
+def createMeasurements(key, measurements, sources, is_oneoff=True, start_time=None, stop_time=None, interval=None):
+    """
+    Creates measurements (as AtlasCreateRequest of the Atlas-toolbox)
+    :param key:             an API key with 'Measurement creation' permissions
+    :param measurements:    a list of measurement definitions (e.g. Ping or Traceroute objects of the Atlas-toolbox)
+    :param sources:         a list of AtlasSource objects
+    :param is_oneoff:       true for one-off measurements
+    :param start_time:      time (UNIX timestamp) at which the measurements should start
+    :param stop_time:       time (UNIX timestamp) at which the measurements should stop
+    :param interval:        time between 2 consecutive runs of the measurements (in seconds)
+    :return:                a tuple (<is_success>, <response>); on success, response['measurements'] holds the IDs of
+                            the created measurements, in the order of <measurements>
+    """
+    definitions = []
+    for measurement in measurements:
+        definition = measurement.build_api_struct()
+        if interval:
+            definition['interval'] = interval
+        definitions.append(definition)
+
+    payload = {'definitions': definitions, 'probes': [source.build_api_struct() for source in sources],
+               'is_oneoff': is_oneoff}
+    if start_time:
+        payload['start_time'] = start_time
+    if stop_time:
+        payload['stop_time'] = stop_time
+
+    return request('POST', 'measurements/', payload=payload, key=key)
+
+
+def getResults(msmID, start=None, stop=None):
+    """
+    Downloads the results of the measurement <msmID> (as AtlasResultsRequest of the Atlas-toolbox)
+    :param msmID:   the ID of the measurement
+    :param start:   if != None, only results obtained at or after this UNIX timestamp are returned
+    :param stop:    if != None, only results obtained at or before this UNIX timestamp are returned
+    :return:        a tuple (<is_success>, <list of results>)
+    """
+    params = {'format': 'json'}
+    if start is not None:
+        params['start'] = start
+    if stop is not None:
+        params['stop'] = stop
+    return request('GET', 'measurements/' + str(msmID) + '/results/', params=params)
+
+
+def getMeasurement(msmID):
+    """
+    Fetches the description (including the status) of the measurement <msmID>, without its results
+    :return:    a tuple (<is_success>, <description>); the name of the status is description['status']['name']
+    """
+    return request('GET', 'measurements/' + str(msmID) + '/')
+
+
+def getProbes(**filters):
+    """
+    Fetches the descriptions of the probes matching <filters> (e.g. status=1), following the pagination
+    :return:    a tuple (<is_success>, <list of probe descriptions>)
+    """
+    probes = []
+    params = dict(filters)
+    params['page_size'] = 500
+    is_success, response = request('GET', 'probes/', params=params)
+    while is_success:
+        probes.extend(response.get('results', []))
+        if not response.get('next'):
+            return True, probes
+        is_success, response = request('GET', response['next'])
+    return False, response
+
+
+def timingSummary():
+    """
+    Returns statistics about the requests sent so far
+    :return:    a dictionary whose keys are HTTP methods and values are tuples (<number of calls>, <mean duration>,
+                <max duration>) computed over the last NB_TIMINGS_KEPT calls
+    """
+    summary = {}
+    for method, _, _, duration in list(timings):
+        count, total, maximum = summary.get(method, (0, 0.0, 0.0))
+        summary[method] = (count + 1, total + duration, max(maximum, duration))
+    return dict((method, (count, total / count, maximum)) for method, (count, total, maximum) in summary.items())
@@ -8,39 +8,150 @@ PO Box 1866, Mountain View, CA 94042, USA.
 
 from __future__ import print_function
 
-from ripe.atlas.cousteau import AtlasResultsRequest
+import time
+import threading
+from multiprocessing.pool import ThreadPool
 
+import disnetperf.AUX_atlas_client as ac
+import disnetperf.AUX_request_scheduler as rs
 
-def checkMeasurements(measurementIDs, verbose):
+
+# global vars - begin
+RUNNING_STATUSES = ('Specified', 'Scheduled', 'Ongoing')
+
+NB_WORKERS_DEFAULT = 8          # number of measurement-statuses that are fetched concurrently
+POLL_INTERVAL_MIN = 10          # minimum time (in seconds) between two polls
+POLL_INTERVAL_MAX = 180         # maximum time (in seconds) between two polls
+POLL_INTERVAL_FACTOR = 1.5      # the interval grows by this factor after each poll during which nothing finished
+# global vars - end
+
+
+def getMeasurementStatus(udm):
     """
-    Check whether measurements are completed
-    :param measurementIDs:  a list of the measurement IDs of the measurements you want to check
-    :param verbose:         if true, an error-message gets displayed when an internal problem occurs; otherwise not
-    :return:                True if every measurement completed; False otherwise
+    Fetches the status of a measurement through the measurement-status endpoint (no results are downloaded)
+    :param udm: the ID of the measurement
+    :return:    a tuple (<udm>, <status>) where <status> is the name of the status (e.g. 'Ongoing', 'Stopped') or None
+                if the status could not be fetched
     """
-    stopped = 0
-    total = 0
+    is_success, response = rs.getScheduler().read(lambda: ac.getMeasurement(udm))
+    if not is_success:
+        return udm, None
+    return udm, (response.get('status') or {}).get('name')
 
-    nbOfConsecutiveFailures = 0
 
-    for udm in measurementIDs:
-        total += 1
-        while True:
-            is_success, statusInfo = AtlasResultsRequest(msm_id=udm).create()
-            if is_success:
-                nbOfConsecutiveFailures = 0
-                break
-            else:
-                nbOfConsecutiveFailures += 1
+class MeasurementPoller:
+    """
+    This class keeps track of the state of a set of measurements and only re-queries the measurements that have not
+    finished yet. Measurements may be added from another thread while the poller is running
+    """
+    def __init__(self, measurementIDs, verbose, nbWorkers=NB_WORKERS_DEFAULT):
+        """
+        Initializes the object's attributes
+        :param measurementIDs:  the IDs of the measurements to track
+        :param verbose:         if true, an error-message gets displayed when an internal problem occurs; otherwise not
+        :param nbWorkers:       the number of statuses fetched concurrently
+        """
+        self.verbose = verbose
+        self.nbWorkers = max(1, nbWorkers)
+        self.states = {}        # keys: measurement IDs; values: last known status (None if not known yet)
+        self.pending = set()    # IDs of the measurements that have not finished yet
+        self.interval = POLL_INTERVAL_MIN
+        self.lock = threading.Lock()
+        self.add(measurementIDs)
 
-                # if 5 consecutive checks failed, abort
-                if nbOfConsecutiveFailures == 5:
-                    if verbose:
+    def add(self, measurementIDs):
+        """
+        Starts tracking the measurements <measurementIDs>
+        """
+        with self.lock:
+            for udm in measurementIDs:
+                if udm not in self.states:
+                    self.states[udm] = None
+                    self.pending.add(udm)
+
+    def poll(self):
+        """
+        Fetches the status of every pending measurement, concurrently
+        :return:    a list of the IDs of the measurements that finished since the last poll; None if a status could not
+                    be fetched
+        """
+        with self.lock:
+            pending = list(self.pending)
+        if not pending:
+            return []
+
+        pool = ThreadPool(min(self.nbWorkers, len(pending)))
+        try:
+            statuses = pool.map(getMeasurementStatus, pending)
+        finally:
+            pool.close()
+            pool.join()
+
+        finished = []
+        with self.lock:
+            for udm, status in statuses:
+                if status is None:
+                    if self.verbose:
                         print('error: Could not check measurement-status!\n')
                     return None
+                self.states[udm] = status
+                if status not in RUNNING_STATUSES:  # UDM finished
+                    self.pending.discard(udm)
+                    finished.append(udm)
+        return finished
 
-        runningFlags = ["'name' => 'Scheduled'", "'name' => 'Ongoing'", "'name' => 'Specified'"]
-        if not any(flag in statusInfo for flag in runningFlags):  # UDM finished
-            stopped += 1
+    def iterFinished(self, moreToCome=None):
+        """
+        Polls the pending measurements until all of them finished and yields the ID of each measurement as soon as it
+        finished. The interval between two polls is reset to POLL_INTERVAL_MIN whenever a measurement finishes and
+        grows up to POLL_INTERVAL_MAX otherwise
+        :param moreToCome:  if != None, a function returning True as long as measurements may still be added (see add);
+                            the generator does not stop while it does, even if every measurement finished
+        :return:            a generator of measurement IDs. If a status could not be fetched, None is yielded and the
+                            generator stops
+        """
+        while True:
+            finished = self.poll()
+            if finished is None:
+                yield None
+                return
 
-    return not (total - stopped > 0)
+            for udm in finished:
+                yield udm
+
+            if not self.pending:
+                if moreToCome is None or not moreToCome():
+                    return
+                self.interval = POLL_INTERVAL_MIN  # nothing to poll: look for new measurements again soon
+            elif finished:
+                self.interval = POLL_INTERVAL_MIN
+            else:
+                self.interval = min(self.interval * POLL_INTERVAL_FACTOR, POLL_INTERVAL_MAX)
+            time.sleep(self.interval)
+
+
+def checkMeasurements(measurementIDs, verbose):
+    """
+    Check whether measurements are completed
+    :param measurementIDs:  a list of the measurement IDs of the measurements you want to check
+    :param verbose:         if true, an error-message gets displayed when an internal problem occurs; otherwise not
+    :return:                True if every measurement completed; False otherwise
+    """
+    poller = MeasurementPoller(measurementIDs, verbose)
+    if poller.poll() is None:
+        return None
+    return not poller.pending
+
+
+def waitForMeasurements(measurementIDs, verbose, nbWorkers=NB_WORKERS_DEFAULT):
+    """
+    Waits until all the measurements <measurementIDs> are completed
+    :param measurementIDs:  a list of the measurement IDs of the measurements you want to wait for
+    :param verbose:         if true, an error-message gets displayed when an internal problem occurs; otherwise not
+    :param nbWorkers:       the number of statuses fetched concurrently
+    :return:                True once every measurement completed; None if a status could not be fetched
+    """
+    for udm in MeasurementPoller(measurementIDs, verbose, nbWorkers).iterFinished():
+        if udm is None:
+            return None
+    return True
@@ -6,8 +6,160 @@ To view a copy of this license, visit http://creativecommons.org/licenses/by-nd/
 PO Box 1866, Mountain View, CA 94042, USA.
 """
 
+from __future__ import print_function
+
+import array
+import bisect
+import glob
 import os
 
+import disnetperf.AUX_packed_index as pi
+
+
+# global vars - begin
+ROUTEVIEWS_DIRECTORY = '../lib/routeviews_paths'
+
+# keys: RouteViews directories; values: the corresponding ASPathIndex objects (validated once per run), or None if the
+# index could not be built, so that the path files are not parsed again for every AS-path
+loadedPathIndexes = {}
+# global vars - end
+
+
+class ASPathIndex:
+    """
+    This class represents an index over the RouteViews AS-paths.
+    AS-hops are interned in <tokens>. For the i-th start-AS of <startASes>, the sorted end-ASes of its paths are
+    endTokens[startOffsets[i]:startOffsets[i + 1]] and pathIDs holds the corresponding path IDs.
+    The hops of path p are pathTokens[pathOffsets[p]:pathOffsets[p + 1]]; identical paths share the same ID
+    """
+    def __init__(self, sections):
+        """
+        Initializes the object's attributes
+        :param sections:    the sections of the index, as returned by AUX_packed_index.loadIndex or storeIndex
+        """
+        self.tokens = sections['tokens']
+        self.tokenToID = dict((token, ID) for ID, token in enumerate(self.tokens))
+        self.startToIdx = dict((start, idx) for idx, start in enumerate(sections['starts']))
+        self.startOffsets = sections['startoffsets']
+        self.endTokens = sections['ends']
+        self.pathIDs = sections['pathids']
+        self.pathOffsets = sections['pathoffsets']
+        self.pathTokens = sections['pathtokens']
+
+    def getASPath(self, start, end):
+        """
+        Returns the AS-path between <start> and <end>
+        :param start:   the start-AS of the path
+        :param end:     the end-AS of the path
+        :return:        a list containing all the AS-hops between <start> and <end> (including <start> and <end>) if a
+                        path was found; an empty list otherwise
+        """
+        if start not in self.startToIdx or end not in self.tokenToID:
+            return []
+
+        startIdx = self.startToIdx[start]
+        lo, hi = self.startOffsets[startIdx], self.startOffsets[startIdx + 1]
+        endToken = self.tokenToID[end]
+
+        idx = bisect.bisect_left(self.endTokens, endToken, lo, hi)
+        if idx == hi or self.endTokens[idx] != endToken:
+            return []
+
+        pathID = self.pathIDs[idx]
+        return [self.tokens[token] for token in self.pathTokens[self.pathOffsets[pathID]:self.pathOffsets[pathID + 1]]]
+
+
+def buildASPathIndex(pathFilenames, indexFilename):
+    """
+    Compiles the RouteViews path files <pathFilenames> into the index file <indexFilename>.
+    When a file contains several paths ending in the same AS, the first one in the file is kept (as when scanning the
+    file sequentially)
+    :param pathFilenames:   list of files named '<start-AS>.txt'; each line is a space-separated AS-path
+    :param indexFilename:   name of the index file to create
+    :return:                the sections of the index (see AUX_packed_index.storeIndex); None if a problem occurred
+    """
+    signature = pi.sourceSignature(pathFilenames)
+    if signature is None:
+        return None
+
+    tokens = []
+    tokenToID = {}
+    paths = {}  # keys: tuples of token IDs; values: path IDs
+
+    startASes = []
+    startOffsets = array.array('I', [0])
+    endTokens = array.array('I')
+    pathIDs = array.array('I')
+    pathOffsets = array.array('I', [0])
+    pathTokens = array.array('I')
+
+    for filename in sorted(pathFilenames):
+        endsToPathIDs = {}
+        try:
+            with open(filename, 'r') as file:
+                for line in file:
+                    pathList = line.split()
+                    if not pathList:
+                        continue
+
+                    path = []
+                    for AS in pathList:
+                        if AS not in tokenToID:
+                            tokenToID[AS] = len(tokens)
+                            tokens.append(AS)
+                        path.append(tokenToID[AS])
+
+                    if path[-1] in endsToPathIDs:
+                        continue
+
+                    path = tuple(path)
+                    if path not in paths:
+                        paths[path] = len(paths)
+                        pathTokens.extend(path)
+                        pathOffsets.append(len(pathTokens))
+                    endsToPathIDs[path[-1]] = paths[path]
+        except IOError:
+            return None
+
+        startASes.append(os.path.basename(filename)[:-len('.txt')])
+        for endToken in sorted(endsToPathIDs):
+            endTokens.append(endToken)
+            pathIDs.append(endsToPathIDs[endToken])
+        startOffsets.append(len(endTokens))
+
+    return pi.storeIndex(indexFilename, signature, {'startoffsets': startOffsets, 'ends': endTokens,
+                                                    'pathids': pathIDs, 'pathoffsets': pathOffsets,
+                                                    'pathtokens': pathTokens},
+                         {'tokens': tokens, 'starts': startASes})
+
+
+def loadASPathIndex(routeViewsDirectory=ROUTEVIEWS_DIRECTORY):
+    """
+    Returns the AS-path index for the files in <routeViewsDirectory>, (re)building it if it is missing or out of date
+    (i.e. when a path file has been added, removed or modified). The index is stored next to the directory, with the
+    extension '.idx'. The index is validated against the path files only the first time it is loaded; if it cannot be
+    built, an error-message gets displayed once and None is returned for the rest of the run
+    :param routeViewsDirectory: the directory containing the RouteViews path files
+    :return:                    an ASPathIndex object; None if a problem occurred
+    """
+    if routeViewsDirectory in loadedPathIndexes:
+        return loadedPathIndexes[routeViewsDirectory]
+
+    pathFilenames = glob.glob(os.path.join(routeViewsDirectory, '*.txt'))
+    signature = pi.sourceSignature(pathFilenames)
+    indexFilename = routeViewsDirectory.rstrip('/') + '.idx'
+    sections = pi.loadIndex(indexFilename, signature) if signature is not None else None
+    if sections is None and signature is not None:
+        sections = buildASPathIndex(pathFilenames, indexFilename)
+
+    if sections is None:
+        print("error: Could not load the RouteViews AS-path index\n")
+        loadedPathIndexes[routeViewsDirectory] = None
+        return None
+
+    loadedPathIndexes[routeViewsDirectory] = ASPathIndex(sections)
+    return loadedPathIndexes[routeViewsDirectory]
+
 
 def getASPath(start, end):
     """
@@ -17,14 +169,8 @@ def getASPath(start, end):
     :return:        a list containing all the AS-hops between <start> and <end> (including <start> and <end>) if a path
                     was found; en empty list otherwise
     """
-    if not os.path.exists('../lib/routeviews_paths/' + start + '.txt'):
+    index = loadASPathIndex()
+    if index is None:
         return []
 
-    with open('../lib/routeviews_paths/' + start + '.txt', 'r') as file:
-        for line in file:
-            pathList = line.rstrip('\r\n').split()
-            if pathList[-1] == end:
-                file.close()
-                return pathList
-
-    return []
+    return index.getASPath(start, end)
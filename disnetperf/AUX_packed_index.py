@@ -0,0 +1,174 @@
+# Author: Sarah Wassermann <sarah@wassermann.lu>
+
+"""
+This work is licensed under the Creative Commons Attribution-NoDerivatives 4.0 International License.
+To view a copy of this license, visit http://creativecommons.org/licenses/by-nd/4.0/ or send a letter to Creative Commons,
+PO Box 1866, Mountain View, CA 94042, USA.
+"""
+
+import array
+import json
+import mmap
+import os
+import struct
+
+
+# global vars - begin
+MAGIC = b'DNPIDX1\n'
+ALIGNMENT = 8
+# global vars - end
+
+
+class PackedArray:
+    """
+    Read-only sequence view on an array of fixed-size items stored in a memory-mapped file.
+    Only used when memoryview.cast() is not available (Python 2)
+    """
+    def __init__(self, buf, offset, typecode, length):
+        """
+        Initializes the object's attributes
+        """
+        self.buf = buf
+        self.offset = offset
+        self.typecode = typecode
+        self.itemsize = struct.calcsize(typecode)
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += self.length
+        if idx < 0 or idx >= self.length:
+            raise IndexError('index out of range')
+        return struct.unpack_from(self.typecode, self.buf, self.offset + idx * self.itemsize)[0]
+
+
+def sourceSignature(filenames):
+    """
+    Returns a signature describing the current state of the source files an index is built from.
+    An index whose stored signature differs from the current one is considered stale
+    :param filenames:   list of the source files
+    :return:            a list of [<basename>, <size>, <mtime>] entries, or None if a source file is missing
+    """
+    signature = []
+    for filename in sorted(filenames):
+        try:
+            st = os.stat(filename)
+        except OSError:
+            return None
+        signature.append([os.path.basename(filename), st.st_size, int(st.st_mtime)])
+    return signature
+
+
+def writeIndex(indexFilename, signature, arrays, strings=None):
+    """
+    Writes the arrays <arrays> and string tables <strings> to the index file <indexFilename>.
+    The file is first written to a temporary file which is then renamed, so that readers never see a partial index
+    :param indexFilename:   name of the index file to create
+    :param signature:       the signature of the source files (see sourceSignature)
+    :param arrays:          a dictionary whose keys are section names and values array.array objects
+    :param strings:         a dictionary whose keys are section names and values lists of strings
+    :return:                True if the index has been written; None if a problem occurred
+    """
+    sections = []
+    payloads = []
+    offset = 0
+
+    for name in sorted(arrays):
+        data = arrays[name]
+        raw = data.tobytes() if hasattr(data, 'tobytes') else data.tostring()
+        sections.append([name, data.typecode, data.itemsize, len(data), offset])
+        payloads.append(raw)
+        offset += len(raw)
+        offset += -offset % ALIGNMENT
+        payloads.append(b'\0' * (-len(raw) % ALIGNMENT))
+
+    for name in sorted(strings or {}):
+        raw = '\n'.join(strings[name]).encode('utf-8')
+        sections.append([name, 's', 1, len(strings[name]), offset, len(raw)])
+        payloads.append(raw)
+        offset += len(raw)
+        offset += -offset % ALIGNMENT
+        payloads.append(b'\0' * (-len(raw) % ALIGNMENT))
+
+    header = json.dumps({'signature': signature, 'sections': sections}).encode('utf-8')
+    header += b' ' * (-(len(MAGIC) + 4 + len(header)) % ALIGNMENT)
+
+    tmpFilename = indexFilename + '.tmp'
+    try:
+        with open(tmpFilename, 'wb') as indexFile:
+            indexFile.write(MAGIC)
+            indexFile.write(struct.pack('<I', len(header)))
+            indexFile.write(header)
+            for payload in payloads:
+                indexFile.write(payload)
+        os.rename(tmpFilename, indexFilename)
+    except (IOError, OSError):
+        return None
+    return True
+
+
+def storeIndex(indexFilename, signature, arrays, strings=None):
+    """
+    Writes an index (see writeIndex) and returns its sections. If the index file cannot be written or read back (for
+    instance if the folder is read-only or the disk is full), the sections are returned from memory, so that the index
+    can still be used until the end of the run
+    :return:    a dictionary whose keys are section names and values sequences, as returned by loadIndex
+    """
+    if writeIndex(indexFilename, signature, arrays, strings) is not None:
+        sections = loadIndex(indexFilename, signature)
+        if sections is not None:
+            return sections
+
+    sections = dict(arrays)
+    sections.update(strings or {})
+    return sections
+
+
+def loadIndex(indexFilename, signature):
+    """
+    Memory-maps the index file <indexFilename> and returns its sections
+    :param indexFilename:   name of the index file
+    :param signature:       the current signature of the source files; if it does not match the stored one, the index
+                            is considered stale
+    :return:                a dictionary whose keys are section names and values sequences (arrays are memory-mapped,
+                            string tables are loaded into lists); None if the index is missing, stale or corrupted
+    """
+    try:
+        with open(indexFilename, 'rb') as indexFile:
+            mm = mmap.mmap(indexFile.fileno(), 0, access=mmap.ACCESS_READ)
+    except (IOError, OSError, ValueError):
+        return None
+
+    try:
+        if mm[:len(MAGIC)] != MAGIC:
+            return None
+        headerLength = struct.unpack_from('<I', mm, len(MAGIC))[0]
+        dataStart = len(MAGIC) + 4 + headerLength
+        header = json.loads(mm[len(MAGIC) + 4:dataStart].decode('utf-8'))
+    except (struct.error, ValueError):
+        return None
+
+    if header['signature'] != signature:
+        return None
+
+    sections = {}
+    for section in header['sections']:
+        name, typecode, itemsize, length, offset = section[:5]
+        start = dataStart + offset
+        if typecode == 's':
+            raw = mm[start:start + section[5]].decode('utf-8')
+            sections[name] = raw.split('\n') if length else []
+            continue
+
+        if array.array(typecode).itemsize != itemsize:  # index written on a different platform
+            return None
+        if start + length * itemsize > len(mm):
+            return None
+        try:
+            sections[name] = memoryview(mm)[start:start + length * itemsize].cast(typecode)
+        except (AttributeError, TypeError):
+            sections[name] = PackedArray(mm, start, typecode, length)
+    return sections
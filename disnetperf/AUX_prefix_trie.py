@@ -0,0 +1,112 @@
+# Author: Sarah Wassermann <sarah@wassermann.lu>
+
+"""
+This work is licensed under the Creative Commons Attribution-NoDerivatives 4.0 International License.
+To view a copy of this license, visit http://creativecommons.org/licenses/by-nd/4.0/ or send a letter to Creative Commons,
+PO Box 1866, Mountain View, CA 94042, USA.
+"""
+
+import ipaddress
+
+
+class PrefixTrieNode(object):
+    """
+    This class represents a node of a PrefixTrie: a prefix and the values stored for it (empty if the node only
+    separates two branches)
+    """
+    __slots__ = ('key', 'length', 'children', 'values')
+
+    def __init__(self, key, length, values=None):
+        """
+        Initializes the object's attributes
+        :param key:     the prefix as an integer (the bits beyond <length> are 0)
+        :param length:  the length of the prefix
+        """
+        self.key = key
+        self.length = length
+        self.children = [None, None]
+        self.values = values if values is not None else []
+
+
+class PrefixTrie:
+    """
+    This class represents a radix trie (path-compressed binary trie) of IPv4 and IPv6 prefixes, each prefix holding a
+    list of values. It returns the values of the most specific prefix covering an IP address in O(prefix length)
+    """
+    def __init__(self):
+        """
+        Initializes the object's attributes
+        """
+        self.roots = {4: PrefixTrieNode(0, 0), 6: PrefixTrieNode(0, 0)}  # keys: IP versions
+        self.widths = {4: 32, 6: 128}
+
+    def insert(self, prefix, value):
+        """
+        Adds <value> to the values of the prefix <prefix>
+        :param prefix:  a prefix in the format X.X.X.X/Y or an IPv6 prefix; the host bits are ignored
+        :return:        True if the value has been added; None if <prefix> is not a valid prefix
+        """
+        try:
+            network = ipaddress.ip_network(u'' + prefix, strict=False)
+        except ValueError:
+            return None
+
+        width = self.widths[network.version]
+        key = int(network.network_address)
+        length = network.prefixlen
+        node = self.roots[network.version]
+
+        while node.length != length:
+            bit = (key >> (width - 1 - node.length)) & 1
+            child = node.children[bit]
+            if child is None:
+                node.children[bit] = PrefixTrieNode(key, length, [value])
+                return True
+
+            common = min(width - (key ^ child.key).bit_length(), length, child.length)
+            if common == child.length:  # <child> covers the prefix
+                node = child
+                continue
+
+            # the prefix and <child> diverge (or the prefix covers <child>): insert a node where they split
+            split = PrefixTrieNode(key & ~((1 << (width - common)) - 1), common)
+            split.children[(child.key >> (width - 1 - common)) & 1] = child
+            if common == length:
+                split.values.append(value)
+            else:
+                split.children[(key >> (width - 1 - common)) & 1] = PrefixTrieNode(key, length, [value])
+            node.children[bit] = split
+            return True
+
+        node.values.append(value)
+        return True
+
+    def longestMatch(self, ip):
+        """
+        Returns the most specific prefix covering the IP address <ip> that holds values
+        :param ip:  an IPv4 or IPv6 address (string)
+        :return:    a tuple (<prefix>, <list of values>) where <prefix> is a string; None if no prefix covers <ip>
+        """
+        try:
+            address = ipaddress.ip_address(u'' + ip)
+        except ValueError:
+            return None
+
+        width = self.widths[address.version]
+        key = int(address)
+        node = self.roots[address.version]
+        best = None
+
+        while node is not None:
+            if (key ^ node.key) >> (width - node.length):  # <node> does not cover <ip>
+                break
+            if node.values:
+                best = node
+            if node.length == width:
+                break
+            node = node.children[(key >> (width - 1 - node.length)) & 1]
+
+        if best is None:
+            return None
+        networkAddress = ipaddress.IPv4Address(best.key) if address.version == 4 else ipaddress.IPv6Address(best.key)
+        return str(networkAddress) + '/' + str(best.length), list(best.values)
@@ -8,6 +8,28 @@ PO Box 1866, Mountain View, CA 94042, USA.
 
 from __future__ import print_function
 
+import array
+import bisect
+
+import disnetperf.AUX_packed_index as pi
+
+
+# global vars - begin
+# relation of a neighbour to the AS it has been looked up for
+REL_CUSTOMER = -1
+REL_PEER = 0
+REL_PROVIDER = 1
+
+# order in which neighbours are considered when looking for candidate probes: customers are usually regional and
+# directly attached, whereas providers may be transit networks spanning the whole world
+RELATION_RANKS = {REL_CUSTOMER: 0, REL_PEER: 1, REL_PROVIDER: 2}
+NEIGHBOURHOOD_MAX_HOPS = 3          # maximum AS-hop distance of the ASes whose probes are used as candidates
+NEIGHBOURHOOD_MIN_PROBES = 50       # the neighbourhood stops growing once its ASes hold at least this number of probes
+
+# keys: relationship files; values: tuples (<ASNeighbourIndex>, <signature of the file it was built from>)
+loadedNeighbourIndexes = {}
+# global vars - end
+
 
 def parseProbeListOutput(output, verbose, map=None):
     """
@@ -37,30 +59,178 @@ def parseProbeListOutput(output, verbose, map=None):
     return [probes[i:i + 500] for i in range(0, len(probes), 500)]
 
 
-def findASNeighbourhood(ASN, verbose):
+class ASNeighbourIndex:
     """
-    Finds neighbours of AS with ASN <ASN> according to CAIDA's relationship dataset.
-    :param ASN:     the ASN of the AS you want to find the neighbours for
-    :param verbose: if true, an error message in case of an internal problem will be displayed, otherwise not
-    :return:        a list of the detected neighbours
+    This class represents an adjacency index over CAIDA's AS relationship dataset, stored in CSR form:
+    the neighbours of the i-th AS of <ASNs> are neighbourASNs[offsets[i]:offsets[i + 1]], and relations[j] describes how
+    neighbourASNs[j] relates to that AS (REL_CUSTOMER, REL_PEER or REL_PROVIDER)
     """
+    def __init__(self, sections):
+        """
+        Initializes the object's attributes
+        :param sections:    the sections of the index file, as returned by AUX_packed_index.loadIndex
+        """
+        self.ASNs = sections['asns']
+        self.offsets = sections['offsets']
+        self.neighbourASNs = sections['neighbours']
+        self.relations = sections['relations']
+
+    def neighbours(self, ASN):
+        """
+        Returns the neighbours of the AS with ASN <ASN>
+        :param ASN: the ASN of the AS (integer or string)
+        :return:    a list of tuples (<neighbour ASN>, <relation>) where <neighbour ASN> is an integer
+        """
+        try:
+            ASN = int(ASN)
+        except ValueError:
+            return []
+
+        idx = bisect.bisect_left(self.ASNs, ASN)
+        if idx == len(self.ASNs) or self.ASNs[idx] != ASN:
+            return []
+        begin, end = self.offsets[idx], self.offsets[idx + 1]
+        return list(zip(self.neighbourASNs[begin:end], self.relations[begin:end]))
+
+
+def buildASNeighbourIndex(neighboursFilename, indexFilename):
+    """
+    Compiles CAIDA's relationship dataset <neighboursFilename> into the index file <indexFilename>
+    :param neighboursFilename:  file containing AS relationships. Line-format: <AS1>|<AS2>|<relation> where <relation> is
+                                -1 if <AS1> is a provider of <AS2> and 0 if both ASes are peers
+    :param indexFilename:       name of the index file to create
+    :return:                    the sections of the index (see AUX_packed_index.storeIndex); None if a problem occurred
+    """
+    signature = pi.sourceSignature([neighboursFilename])
+    if signature is None:
+        return None
+
+    adjacency = {}
     try:
-        with open('../lib/ASNeighbours.txt', 'r') as file:
-            neighbours = set()
+        with open(neighboursFilename, 'r') as file:
             for line in file:
                 line = line.rstrip('\r\n')
                 if not line or line.isspace() or line.startswith('#'):
                     continue
 
                 line = line.split('|')
-                if ASN in line:
-                    if line[0] == ASN:
-                        neighbours.add(line[1])
-                    else:
-                        neighbours.add(line[0])
-            return list(neighbours)
-    except IOError:
+                AS1, AS2 = int(line[0]), int(line[1])
+                if line[2] == '-1':  # AS1 is a provider of AS2
+                    adjacency.setdefault(AS1, {})[AS2] = REL_CUSTOMER
+                    adjacency.setdefault(AS2, {})[AS1] = REL_PROVIDER
+                else:
+                    adjacency.setdefault(AS1, {})[AS2] = REL_PEER
+                    adjacency.setdefault(AS2, {})[AS1] = REL_PEER
+    except (IOError, ValueError, IndexError):
+        return None
+
+    ASNs = array.array('I', sorted(adjacency))
+    offsets = array.array('I', [0])
+    neighbourASNs = array.array('I')
+    relations = array.array('b')
+
+    for ASN in ASNs:
+        for neighbour in sorted(adjacency[ASN]):
+            neighbourASNs.append(neighbour)
+            relations.append(adjacency[ASN][neighbour])
+        offsets.append(len(neighbourASNs))
+
+    return pi.storeIndex(indexFilename, signature, {'asns': ASNs, 'offsets': offsets, 'neighbours': neighbourASNs,
+                                                    'relations': relations})
+
+
+def loadASNeighbourIndex(verbose, neighboursFilename='../lib/ASNeighbours.txt'):
+    """
+    Returns the adjacency index for <neighboursFilename>, (re)building it if it is missing or out of date.
+    The index is stored next to the relationship file, with the extension '.idx'
+    :param verbose:             if true, an error message in case of an internal problem will be displayed, otherwise not
+    :param neighboursFilename:  file containing AS relationships
+    :return:                    an ASNeighbourIndex object; None if a problem occurred
+    """
+    signature = pi.sourceSignature([neighboursFilename])
+    if signature is None:
         if verbose:
-            print("error: Could not open file '../lib/ASNeighbours.txt'\n")
+            print("error: Could not open file '" + neighboursFilename + "'\n")
         return None
 
+    if neighboursFilename in loadedNeighbourIndexes:
+        index, indexSignature = loadedNeighbourIndexes[neighboursFilename]
+        if indexSignature == signature:
+            return index
+
+    indexFilename = neighboursFilename + '.idx'
+    sections = pi.loadIndex(indexFilename, signature)
+    if sections is None:
+        sections = buildASNeighbourIndex(neighboursFilename, indexFilename)
+        if sections is None:
+            if verbose:
+                print("error: Could not build index '" + indexFilename + "'\n")
+            return None
+
+    loadedNeighbourIndexes[neighboursFilename] = (ASNeighbourIndex(sections), signature)
+    return loadedNeighbourIndexes[neighboursFilename][0]
+
+
+def findASNeighbourhood(ASN, verbose):
+    """
+    Finds neighbours of AS with ASN <ASN> according to CAIDA's relationship dataset.
+    :param ASN:     the ASN of the AS you want to find the neighbours for
+    :param verbose: if true, an error message in case of an internal problem will be displayed, otherwise not
+    :return:        a list of the detected neighbours
+    """
+    index = loadASNeighbourIndex(verbose)
+    if index is None:
+        return None
+
+    return [str(neighbour) for neighbour, _ in index.neighbours(ASN)]
+
+
+def findRankedASNeighbourhood(ASN, verbose, nbProbesInAS, minProbes=NEIGHBOURHOOD_MIN_PROBES,
+                              maxHops=NEIGHBOURHOOD_MAX_HOPS):
+    """
+    Explores the AS graph of CAIDA's relationship dataset breadth-first from the AS with ASN <ASN> and returns the ASes
+    holding probes, ranked by AS-hop distance and, for a given distance, by the relation of the AS to the AS it has been
+    reached from (see RELATION_RANKS). The exploration stops as soon as the returned ASes hold <minProbes> probes
+    :param ASN:             the ASN of the AS you want to find the neighbourhood for
+    :param verbose:         if true, an error message in case of an internal problem will be displayed, otherwise not
+    :param nbProbesInAS:    a function returning the number of probes located in an AS (given as a string)
+    :param minProbes:       the number of probes after which the exploration stops
+    :param maxHops:         the maximum AS-hop distance of the returned ASes
+    :return:                a list of ASNs (strings), from the best ranked AS to the worst ranked one; None if a problem
+                            occurred
+    """
+    index = loadASNeighbourIndex(verbose)
+    if index is None:
+        return None
+
+    try:
+        origin = int(ASN)
+    except ValueError:
+        return []
+
+    visited = set([origin])
+    level = [origin]
+    ranked = []
+    nbProbes = 0
+    for _ in range(maxHops):
+        # the ASes of the next level, ordered by relation and then by the rank of the AS they have been reached from
+        nextLevel = []
+        for parent in level:
+            for neighbour, relation in index.neighbours(parent):
+                if neighbour not in visited:
+                    visited.add(neighbour)
+                    nextLevel.append((RELATION_RANKS[relation], len(nextLevel), neighbour))
+        nextLevel.sort()
+
+        level = []
+        for _, _, neighbour in nextLevel:
+            level.append(neighbour)
+            count = nbProbesInAS(str(neighbour))
+            if count:
+                ranked.append(str(neighbour))
+                nbProbes += count
+                if nbProbes >= minProbes:
+                    return ranked
+        if not level:
+            break
+    return ranked
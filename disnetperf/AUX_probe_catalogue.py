@@ -0,0 +1,266 @@
+# Author: Sarah Wassermann <sarah@wassermann.lu>
+
+"""
+This work is licensed under the Creative Commons Attribution-NoDerivatives 4.0 International License.
+To view a copy of this license, visit http://creativecommons.org/licenses/by-nd/4.0/ or send a letter to Creative Commons,
+PO Box 1866, Mountain View, CA 94042, USA.
+"""
+
+from __future__ import print_function
+
+import heapq
+import random
+import threading
+
+import disnetperf.AUX_atlas_client as ac
+import disnetperf.AUX_prefix_trie as pt
+import disnetperf.AUX_request_scheduler as rs
+import disnetperf.AUX_spatial_index as si
+
+
+# global vars - begin
+PROBELIST_FILENAME = '../lib/probelist.txt'
+STATUS_CONNECTED = 1
+
+loadedCatalogues = {}  # keys: probe-list filenames; values: the corresponding ProbeCatalogue objects
+# global vars - end
+
+
+class Probe:
+    """
+    This class represents a RIPE Atlas probe of the catalogue
+    """
+    def __init__(self, ID, IP, prefix, AS, country, latitude, longitude, status):
+        """
+        Initializes the object's attributes
+        """
+        self.ID = ID                # the probe's ID (integer)
+        self.IP = IP                # the probe's IPv4 address; 'NA' if unknown
+        self.prefix = prefix        # the prefix the probe is located in (IPv4 or IPv6); 'NA' if unknown
+        self.AS = AS                # the ASN (string) the probe is located in
+        self.country = country      # the ISO country code
+        self.latitude = latitude    # latitude and longitude are both 0.0 if the location is unknown
+        self.longitude = longitude
+        self.status = status        # the probe's status ID (1 if connected)
+
+
+class ProbeCatalogue:
+    """
+    This class holds the connected RIPE Atlas probes, indexed by ASN, by prefix and by location, so that candidate
+    probes can be selected without querying the RIPE Atlas API per AS
+    """
+    def __init__(self):
+        """
+        Initializes the object's attributes
+        """
+        self.probes = {}            # keys: probe IDs; values: Probe objects
+        self.ASToProbeIDs = {}      # keys: ASNs (strings); values: lists of probe IDs
+        self.prefixTrie = pt.PrefixTrie()  # values of a prefix: the IDs of the probes located in it
+        self.spatialIndex = si.KDTree([])  # values: the IDs of the probes whose location is known
+        self.lock = threading.Lock()
+        self.refreshThread = None
+
+    def setProbes(self, probes):
+        """
+        Replaces the content of the catalogue by the connected probes of the list <probes>
+        :param probes:  a list of Probe objects
+        """
+        probesMap = {}
+        ASToProbeIDs = {}
+        prefixTrie = pt.PrefixTrie()
+        locatedProbes = []
+        for probe in probes:
+            if probe.status != STATUS_CONNECTED:
+                continue
+            probesMap[probe.ID] = probe
+            ASToProbeIDs.setdefault(probe.AS, []).append(probe.ID)
+            if probe.prefix != 'NA':
+                prefixTrie.insert(probe.prefix, probe.ID)
+            if probe.latitude != 0.0 or probe.longitude != 0.0:
+                locatedProbes.append((si.toUnitVector(probe.latitude, probe.longitude), probe.ID))
+        spatialIndex = si.KDTree(locatedProbes)
+
+        with self.lock:
+            self.probes = probesMap
+            self.ASToProbeIDs = ASToProbeIDs
+            self.prefixTrie = prefixTrie
+            self.spatialIndex = spatialIndex
+
+    def loadFromFile(self, filename, verbose):
+        """
+        Loads the probes of the file <filename>
+        :param filename:    the probe-list file. Line-format (tab-separated):
+                            <ID> <IP> <prefix> <AS> <country> <latitude> <longitude> <status>
+        :param verbose:     if true, an error message gets displayed when an internal problem occurs, otherwise not
+        :return:            True if the probes have been loaded; None otherwise
+        """
+        probes = []
+        try:
+            with open(filename, 'r') as plFile:
+                for line in plFile:
+                    line = line.rstrip('\r\n')
+                    if not line:
+                        continue
+
+                    probeData = line.split('\t')
+                    probes.append(Probe(int(probeData[0]), probeData[1], probeData[2], probeData[3], probeData[4],
+                                        float(probeData[5]), float(probeData[6]), int(probeData[7])))
+        except (IOError, ValueError, IndexError):
+            if verbose:
+                print("error: Could not load file '" + filename + "'\n")
+            return None
+
+        self.setProbes(probes)
+        return True
+
+    def refreshFromAPI(self, verbose):
+        """
+        Reloads the connected probes through the RIPE Atlas API
+        :param verbose: if true, an error message gets displayed when an internal problem occurs, otherwise not
+        :return:        True if the catalogue has been refreshed; None otherwise
+        """
+        is_success, response = rs.getScheduler().read(lambda: ac.getProbes(status=STATUS_CONNECTED))
+        if not is_success:
+            if verbose:
+                print('error: Could not refresh the probe catalogue through the RIPE Atlas API\n')
+            return None
+
+        probes = []
+        for el in response:
+            if not el.get('asn_v4'):
+                continue
+            coordinates = (el.get('geometry') or {}).get('coordinates') or [0.0, 0.0]
+            probes.append(Probe(el['id'], el.get('address_v4') or 'NA', el.get('prefix_v4') or 'NA',
+                                str(el['asn_v4']), el.get('country_code') or 'NA', coordinates[1], coordinates[0],
+                                el['status']['id']))
+
+        if probes:
+            self.setProbes(probes)
+        return True
+
+    def startBackgroundRefresh(self, verbose):
+        """
+        Refreshes the catalogue through the RIPE Atlas API in a background thread. The catalogue keeps serving the
+        previously loaded probes until the refresh is done
+        :param verbose: if true, an error message gets displayed when an internal problem occurs, otherwise not
+        """
+        if self.refreshThread is not None and self.refreshThread.is_alive():
+            return
+        self.refreshThread = threading.Thread(target=self.refreshFromAPI, args=(verbose,))
+        self.refreshThread.daemon = True
+        self.refreshThread.start()
+
+    def probesInAS(self, ASN):
+        """
+        Returns the IDs of the connected probes located in the AS with ASN <ASN>
+        """
+        with self.lock:
+            return list(self.ASToProbeIDs.get(str(ASN), []))
+
+    def nbProbesInAS(self, ASN):
+        """
+        Returns the number of connected probes located in the AS with ASN <ASN>
+        """
+        with self.lock:
+            return len(self.ASToProbeIDs.get(str(ASN), ()))
+
+    def probesInPrefix(self, IP):
+        """
+        Returns the connected probes sharing the most specific covering prefix with the IP <IP>
+        :param IP:  an IPv4 or IPv6 address (string)
+        :return:    a tuple (<prefix>, <list of probe IDs>); None if no probe is located in a prefix covering <IP>
+        """
+        with self.lock:
+            prefixTrie = self.prefixTrie
+        return prefixTrie.longestMatch(IP)
+
+    def nearestProbes(self, latitude, longitude, nb, probeIDs=None):
+        """
+        Returns the <nb> connected probes geographically nearest to the location <latitude>/<longitude>
+        :param probeIDs:    if != None, the probes are chosen among these IDs only; probes whose location is unknown
+                            are then only chosen if there are not enough located ones
+        :return:            a list of probe IDs, from the nearest probe to the farthest one
+        """
+        point = si.toUnitVector(latitude, longitude)
+        with self.lock:
+            if probeIDs is None:
+                spatialIndex = self.spatialIndex
+            else:
+                candidates = [self.probes[ID] for ID in probeIDs if ID in self.probes]
+        if probeIDs is None:
+            return spatialIndex.nearest(point, nb)
+
+        def distance(probe):
+            if probe.latitude == 0.0 and probe.longitude == 0.0:
+                return float('inf')
+            return si.squaredDistance(point, si.toUnitVector(probe.latitude, probe.longitude))
+        return [probe.ID for probe in heapq.nsmallest(nb, candidates, key=distance)]
+
+    def candidateProbes(self, ASN, neighbours):
+        """
+        Returns the candidate probes for a target located in the AS <ASN>: the probes of <ASN> if there are any;
+        the probes of all the ASes in <neighbours> otherwise, in the order of <neighbours>
+        :param ASN:         the ASN of the target's AS
+        :param neighbours:  a list of the ASNs of the ASes in the neighbourhood of <ASN>
+        :return:            a list of probe IDs
+        """
+        probes = self.probesInAS(ASN)
+        if probes:
+            return probes
+
+        seen = set()
+        for neighbour in neighbours:
+            for probe in self.probesInAS(neighbour):
+                if probe not in seen:
+                    seen.add(probe)
+                    probes.append(probe)
+        return probes
+
+    def connectedProbes(self):
+        """
+        Returns a list of tuples (<probe ID>, <AS>) describing all the connected probes
+        """
+        with self.lock:
+            return [(ID, self.probes[ID].AS) for ID in sorted(self.probes)]
+
+    def sampleProbes(self, nb):
+        """
+        Returns the IDs of <nb> connected probes chosen randomly
+        """
+        with self.lock:
+            IDs = list(self.probes)
+        return random.sample(IDs, min(nb, len(IDs)))
+
+    def getAS(self, probeID):
+        """
+        Returns the ASN of the probe <probeID>; None if the probe is unknown
+        """
+        with self.lock:
+            probe = self.probes.get(int(probeID))
+        return probe.AS if probe is not None else None
+
+    def describe(self, probeIDs):
+        """
+        Returns descriptions of the probes <probeIDs> in the format of the RIPE Atlas API (as expected by
+        AUX_probe_analysing.parseProbeListOutput)
+        """
+        with self.lock:
+            return [{'id': ID, 'asn_v4': self.probes[ID].AS} for ID in probeIDs if ID in self.probes]
+
+
+def loadProbeCatalogue(verbose, filename=PROBELIST_FILENAME):
+    """
+    Returns the probe catalogue built from <filename>; the file is only parsed once per run
+    :param verbose:     if true, an error message gets displayed when an internal problem occurs, otherwise not
+    :param filename:    the probe-list file
+    :return:            a ProbeCatalogue object; None if a problem occurred
+    """
+    if filename in loadedCatalogues:
+        return loadedCatalogues[filename]
+
+    catalogue = ProbeCatalogue()
+    if catalogue.loadFromFile(filename, verbose) is None:
+        return None
+
+    loadedCatalogues[filename] = catalogue
+    return catalogue
@@ -0,0 +1,150 @@
+# Author: Sarah Wassermann <sarah@wassermann.lu>
+
+"""
+This work is licensed under the Creative Commons Attribution-NoDerivatives 4.0 International License.
+To view a copy of this license, visit http://creativecommons.org/licenses/by-nd/4.0/ or send a letter to Creative Commons,
+PO Box 1866, Mountain View, CA 94042, USA.
+"""
+
+from __future__ import print_function
+
+import os
+import time
+from collections import OrderedDict
+
+import ipaddress
+
+
+# global vars - begin
+CACHE_FILENAME = '../logs/psbox_cache.txt'
+CACHE_SIZE_DEFAULT = 100000     # maximum number of entries kept in the cache
+
+# levels of fallback when no entry exists for the exact IP
+FALLBACK_NONE = 0       # exact IP only
+FALLBACK_PREFIX = 1     # exact IP, then an IP of the same covering prefix (/24 or /48) and AS
+FALLBACK_AS = 2         # exact IP, covering prefix, then any IP of the same AS
+
+PREFIX_LENGTH_V4 = 24
+PREFIX_LENGTH_V6 = 48
+# global vars - end
+
+
+def coveringPrefix(IP):
+    """
+    Returns the covering prefix of <IP> used as cache key (/24 for IPv4, /48 for IPv6)
+    """
+    address = ipaddress.ip_address(IP)
+    length = PREFIX_LENGTH_V4 if address.version == 4 else PREFIX_LENGTH_V6
+    return str(ipaddress.ip_network(IP + '/' + str(length), strict=False))
+
+
+class PSBoxCache:
+    """
+    This class represents a persistent cache of closest boxes. An entry describes the closest box to a target
+    (probe ID, probe IP, probe AS, min RTT, label) and the time at which it was measured. Entries are stored under the
+    target IP, the target's covering prefix and the target's AS. Only the entries measured less than <ttl> seconds ago
+    are returned by lookup, but older entries are kept: the least recently used entries are evicted when the cache holds
+    more than <maxEntries> entries
+    """
+    def __init__(self, ttl, fallback=FALLBACK_NONE, maxEntries=CACHE_SIZE_DEFAULT, filename=CACHE_FILENAME):
+        """
+        Initializes the object's attributes
+        :param ttl:         the time (in seconds) during which an entry is considered fresh (if <= 0, no entry is)
+        :param fallback:    FALLBACK_NONE, FALLBACK_PREFIX or FALLBACK_AS
+        :param maxEntries:  the maximum number of entries kept in the cache
+        :param filename:    the file the cache is stored in
+        """
+        self.ttl = ttl
+        self.fallback = fallback
+        self.maxEntries = maxEntries
+        self.filename = filename
+        self.entries = OrderedDict()  # keys: cache keys; values: tuples (<probeID>, <probeIP>, <probeAS>, <minRTT>,
+                                      # <label>, <timestamp>); ordered from the least to the most recently used
+
+    def load(self):
+        """
+        Loads the entries of the cache file. A missing file is treated as an empty cache and malformed lines are skipped
+        :return:    True if the cache has been loaded; None if the file could not be read
+        """
+        if not os.path.exists(self.filename):
+            return True
+
+        try:
+            with open(self.filename, 'r') as cacheFile:
+                for line in cacheFile:
+                    data = line.rstrip('\r\n').split('\t')
+                    if len(data) != 7:
+                        continue
+                    try:
+                        self.entries[data[0]] = (int(data[1]), data[2], data[3], data[4], data[5], float(data[6]))
+                    except ValueError:  # malformed line
+                        continue
+        except IOError:
+            return None
+
+        self.evict()
+        return True
+
+    def save(self):
+        """
+        Writes the cache to its file
+        :return:    True if the cache has been written; None otherwise
+        """
+        tmpFilename = self.filename + '.tmp'
+        try:
+            with open(tmpFilename, 'w') as cacheFile:
+                for key in self.entries:
+                    cacheFile.write(key + '\t' + '\t'.join(map(str, self.entries[key])) + '\n')
+            os.rename(tmpFilename, self.filename)
+        except (IOError, OSError):
+            return None
+        return True
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the cache holds at most <maxEntries> entries
+        """
+        while len(self.entries) > self.maxEntries:
+            self.entries.popitem(last=False)
+
+    def keys(self, IP, AS):
+        """
+        Returns the cache keys of the target <IP> located in <AS>, from the most to the least specific one
+        """
+        keys = ['ip:' + IP]
+        if AS != 'NA_MAP':
+            keys.append('prefix:' + AS + ':' + coveringPrefix(IP))
+            keys.append('as:' + AS)
+        return keys
+
+    def lookup(self, IP, AS):
+        """
+        Returns the fresh cached closest box to <IP>
+        :param IP:  the target IP
+        :param AS:  the AS <IP> is located in ('NA_MAP' if unknown)
+        :return:    a tuple (<probeID>, <probeIP>, <probeAS>, <minRTT>, <label>); None if there is no fresh entry
+        """
+        now = time.time()
+        for key in self.keys(IP, AS)[:self.fallback + 1]:
+            entry = self.entries.get(key)
+            if entry is None or now - entry[5] >= self.ttl:  # stale entries are kept until they are evicted
+                continue
+
+            del self.entries[key]  # mark as most recently used
+            self.entries[key] = entry
+            return entry[:5]
+        return None
+
+    def add(self, IP, AS, closestBox, label):
+        """
+        Stores the closest box <closestBox> to <IP>
+        :param IP:          the target IP
+        :param AS:          the AS <IP> is located in ('NA_MAP' if unknown)
+        :param closestBox:  a tuple (<probeID>, <probeIP>, <probeAS>, <minRTT>)
+        :param label:       the label of the measurement ([OK], [NO_AS] or [RANDOM])
+        """
+        entry = tuple(closestBox) + (label, time.time())
+        for key in self.keys(IP, AS):
+            self.entries.pop(key, None)
+            self.entries[key] = entry
+        self.evict()
@@ -0,0 +1,187 @@
+# Author: Sarah Wassermann <sarah@wassermann.lu>
+
+"""
+This work is licensed under the Creative Commons Attribution-NoDerivatives 4.0 International License.
+To view a copy of this license, visit http://creativecommons.org/licenses/by-nd/4.0/ or send a letter to Creative Commons,
+PO Box 1866, Mountain View, CA 94042, USA.
+"""
+
+import random
+import threading
+import time
+
+
+# global vars - begin
+CREATE_RATE_DEFAULT = 1.0       # measurement-creation requests per second
+CREATE_BURST_DEFAULT = 5        # measurement-creation requests that may be sent at once after an idle period
+READ_RATE_DEFAULT = 10.0        # read requests (results, statuses, probes) per second
+READ_BURST_DEFAULT = 20
+MAX_CONCURRENCY_DEFAULT = 16    # maximum number of API requests in flight, all kinds included
+
+NB_TRIES = 5                    # number of tries before giving up on an API request
+RETRY_DELAY_INITIAL = 5         # upper bound (in seconds) of the delay before the first retry; doubled after each failure
+RETRY_DELAY_MAX = 180
+
+HTTP_TOO_MANY_REQUESTS = 429
+
+scheduler = None                # the scheduler shared by all the scripts (see getScheduler)
+schedulerLock = threading.Lock()
+# global vars - end
+
+
+class TokenBucket:
+    """
+    This class represents a token bucket: tokens are added at <rate> per second, up to <capacity>, and each request
+    consumes one token
+    """
+    def __init__(self, rate, capacity):
+        """
+        Initializes the object's attributes
+        """
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.last = time.time()
+        self.pausedUntil = 0.0  # no token is handed out before this time (set when the server throttles us)
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Blocks until a token is available and consumes it
+        """
+        while True:
+            with self.lock:
+                now = time.time()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if now >= self.pausedUntil and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(self.pausedUntil - now, (1 - self.tokens) / self.rate)
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """
+        Stops handing out tokens for <seconds> seconds
+        """
+        with self.lock:
+            self.pausedUntil = max(self.pausedUntil, time.time() + seconds)
+            self.tokens = 0.0
+
+
+def isThrottled(response):
+    """
+    Checks whether the error-response <response> of the RIPE Atlas API indicates that we are sending too many requests
+    :return:    a tuple (<throttled>, <retry after>) where <retry after> is the number of seconds the server asked us to
+                wait (None if not indicated)
+    """
+    if isinstance(response, dict):
+        error = response.get('error')
+        if isinstance(error, dict) and error.get('status') == HTTP_TOO_MANY_REQUESTS:
+            return True, error.get('retry_after')
+        return False, None
+    return str(HTTP_TOO_MANY_REQUESTS) in str(response) or 'Too Many Requests' in str(response), None
+
+
+def isRejected(response):
+    """
+    Checks whether the error-response <response> of the RIPE Atlas API indicates that the request itself was rejected
+    (HTTP status 4xx other than 429, for instance because of an invalid target)
+    :return:    True if the request was rejected; False otherwise
+    """
+    if isinstance(response, dict):
+        error = response.get('error')
+        if isinstance(error, dict) and isinstance(error.get('status'), int):
+            return 400 <= error['status'] < 500 and error['status'] != HTTP_TOO_MANY_REQUESTS
+    return False
+
+
+class RequestScheduler:
+    """
+    This class schedules all the requests sent to the RIPE Atlas API: creation and read requests are rate-limited
+    through separate token buckets, the number of requests in flight is capped, and failed requests are retried with
+    exponential backoff and jitter. When the server throttles us, the corresponding bucket is paused
+    """
+    def __init__(self, createRate=CREATE_RATE_DEFAULT, createBurst=CREATE_BURST_DEFAULT, readRate=READ_RATE_DEFAULT,
+                 readBurst=READ_BURST_DEFAULT, maxConcurrency=MAX_CONCURRENCY_DEFAULT, nbTries=NB_TRIES):
+        """
+        Initializes the object's attributes
+        """
+        self.buckets = {'create': TokenBucket(createRate, createBurst), 'read': TokenBucket(readRate, readBurst)}
+        self.maxConcurrency = maxConcurrency
+        self.inFlight = threading.BoundedSemaphore(maxConcurrency)
+        self.nbTries = nbTries
+
+    def call(self, kind, request, accept=None):
+        """
+        Sends a request, retrying it until it succeeds or <nbTries> tries failed. Creation requests rejected by RIPE
+        Atlas (see isRejected) are not retried
+        :param kind:    'create' or 'read'
+        :param request: a function without arguments sending the request and returning a tuple (<is_success>,
+                        <response>), as the create()-methods of the Atlas-toolbox
+        :param accept:  if != None, a function called with a successful response; the request is retried if it
+                        returns False (for instance, to wait for results that are not available yet)
+        :return:        the tuple (<is_success>, <response>) returned by the last try
+        """
+        bucket = self.buckets[kind]
+        delay = RETRY_DELAY_INITIAL
+        is_success, response = False, None
+
+        for attempt in range(self.nbTries):
+            bucket.acquire()
+            with self.inFlight:
+                try:
+                    is_success, response = request()
+                except IOError as e:  # network problem
+                    is_success, response = False, str(e)
+
+            if is_success and (accept is None or accept(response)):
+                return is_success, response
+            if attempt == self.nbTries - 1:
+                break
+            if kind == 'create' and not is_success and isRejected(response):  # sending it again would be rejected too
+                break
+
+            wait = random.uniform(0, delay)
+            if not is_success:
+                throttled, retryAfter = isThrottled(response)
+                if throttled:
+                    wait = max(wait, retryAfter or delay)
+                    bucket.pause(wait)
+            time.sleep(wait)
+            delay = min(2 * delay, RETRY_DELAY_MAX)
+
+        return is_success, response
+
+    def create(self, request, accept=None):
+        """
+        Sends a measurement-creation request (see call)
+        """
+        return self.call('create', request, accept)
+
+    def read(self, request, accept=None):
+        """
+        Sends a read request (see call)
+        """
+        return self.call('read', request, accept)
+
+
+def getScheduler():
+    """
+    Returns the scheduler shared by all the scripts, creating it with the default limits if needed
+    """
+    global scheduler
+    with schedulerLock:
+        if scheduler is None:
+            scheduler = RequestScheduler()
+        return scheduler
+
+
+def configureScheduler(**kwargs):
+    """
+    Replaces the shared scheduler by one created with the limits <kwargs> (see RequestScheduler)
+    """
+    global scheduler
+    with schedulerLock:
+        scheduler = RequestScheduler(**kwargs)
+        return scheduler
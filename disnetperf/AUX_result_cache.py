@@ -0,0 +1,232 @@
+# Author: Sarah Wassermann <sarah@wassermann.lu>
+
+"""
+This work is licensed under the Creative Commons Attribution-NoDerivatives 4.0 International License.
+To view a copy of this license, visit http://creativecommons.org/licenses/by-nd/4.0/ or send a letter to Creative Commons,
+PO Box 1866, Mountain View, CA 94042, USA.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from functools import partial
+
+import disnetperf.AUX_atlas_client as ac
+import disnetperf.AUX_check_measurements as cm
+import disnetperf.AUX_request_scheduler as rs
+
+
+# global vars - begin
+CACHE_DIRECTORY = '../logs/results_cache'
+REVALIDATE_AFTER_DEFAULT = 0    # time (in seconds) after which the cached results of an ongoing measurement are
+                                # downloaded again (0: each time they are requested)
+SETTLE_DELAY_DEFAULT = 3600     # time (in seconds) after the end of a measurement (or of a time window) during which
+                                # probes may still upload results: results downloaded earlier are not considered final
+MAX_AGE_DEFAULT = 30 * 86400    # entries that have not been used for this time (in seconds) are removed
+MAX_SIZE_DEFAULT = 512 * 2**20  # maximum size (in bytes) of the cache; the least recently used entries are removed
+PRUNE_EVERY = 100               # the cache is pruned every PRUNE_EVERY stored entries
+
+cache = None                    # the cache shared by all the scripts (see getCache); False if disabled
+cacheLock = threading.Lock()
+# global vars - end
+
+
+class ResultCache:
+    """
+    This class represents an on-disk cache of measurement results. An entry holds the raw results of a measurement
+    over a time window, stored as compressed JSON in a file whose name is derived from the measurement ID and the
+    window. Entries downloaded more than <settleDelay> seconds after the end of the measurement (or of the window) never
+    change and are reused until they are evicted. An entry keeps the time at which its measurement stopped, so that it
+    is downloaded only once more after the measurement settled. Other entries are downloaded again once they are older
+    than <revalidateAfter> seconds, and only reused beyond that if the API cannot be reached. Entries unused for
+    <maxAge> seconds are removed, as well as the least recently used ones when the cache grows beyond <maxSize> bytes
+    """
+    def __init__(self, directory=CACHE_DIRECTORY, revalidateAfter=REVALIDATE_AFTER_DEFAULT,
+                 settleDelay=SETTLE_DELAY_DEFAULT, maxAge=MAX_AGE_DEFAULT, maxSize=MAX_SIZE_DEFAULT):
+        """
+        Initializes the object's attributes
+        """
+        self.directory = directory
+        self.revalidateAfter = revalidateAfter
+        self.settleDelay = settleDelay
+        self.maxAge = maxAge
+        self.maxSize = maxSize
+        self.nbStored = 0
+        self.lock = threading.Lock()
+
+    def filename(self, msmID, start=None, stop=None):
+        """
+        Returns the file in which the results of measurement <msmID> between <start> and <stop> are stored
+        """
+        key = hashlib.sha1((str(msmID) + ':' + str(start) + ':' + str(stop)).encode('ascii')).hexdigest()
+        return os.path.join(self.directory, key[:2], key + '.json.gz')
+
+    def lookup(self, msmID, start=None, stop=None):
+        """
+        Returns the cached entry of the results of measurement <msmID> between <start> and <stop>, and marks it as
+        recently used
+        :return:    a dictionary with the keys 'final' (true if the results can no longer change), 'fetched' (the UNIX
+                    timestamp of the download), 'stopped' (the UNIX timestamp at which the measurement stopped; None if
+                    unknown) and 'results'; None if not cached
+        """
+        filename = self.filename(msmID, start, stop)
+        try:
+            with gzip.open(filename, 'rb') as cacheFile:
+                entry = json.loads(cacheFile.read().decode('utf-8'))
+            os.utime(filename, None)
+        except (IOError, OSError, ValueError, EOFError):
+            return None
+        if not isinstance(entry, dict) or not isinstance(entry.get('results'), list):
+            return None
+        return entry
+
+    def store(self, msmID, start, stop, results, final, stopped=None):
+        """
+        Stores the results <results> of measurement <msmID> between <start> and <stop>
+        :param final:   true if the results can no longer change
+        :param stopped: the time (UNIX timestamp) at which the measurement stopped; None if it has not stopped yet or if
+                        unknown
+        :return:        True if the entry has been written; None otherwise
+        """
+        with self.lock:
+            self.nbStored += 1
+            if self.nbStored % PRUNE_EVERY == 0:
+                self.prune()
+
+        filename = self.filename(msmID, start, stop)
+        tmpFilename = filename + '.' + str(threading.current_thread().ident) + '.tmp'
+        entry = {'msm_id': msmID, 'start': start, 'stop': stop, 'final': bool(final), 'fetched': time.time(),
+                 'stopped': stopped, 'results': results}
+        try:
+            if not os.path.isdir(os.path.dirname(filename)):
+                os.makedirs(os.path.dirname(filename))
+        except OSError:  # created concurrently
+            pass
+        try:
+            with gzip.open(tmpFilename, 'wb') as cacheFile:
+                cacheFile.write(json.dumps(entry, separators=(',', ':')).encode('utf-8'))
+            os.rename(tmpFilename, filename)
+        except (IOError, OSError):
+            return None
+        return True
+
+    def prune(self):
+        """
+        Removes the entries that have not been used for <maxAge> seconds, then the least recently used ones until the
+        cache holds at most <maxSize> bytes
+        """
+        now = time.time()
+        entries = []  # tuples (<last use>, <size>, <filename>)
+        for dirpath, _, filenames in os.walk(self.directory):
+            for name in filenames:
+                filename = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(filename)
+                except OSError:
+                    continue
+                if name.endswith('.json.gz'):
+                    entries.append((st.st_mtime, st.st_size, filename))
+                elif name.endswith('.tmp') and now - st.st_mtime > self.settleDelay:  # left by an interrupted store
+                    entries.append((0, st.st_size, filename))
+
+        entries.sort()
+        size = sum(entry[1] for entry in entries)
+        for lastUse, entrySize, filename in entries:
+            if now - lastUse <= self.maxAge and size <= self.maxSize:
+                break
+            try:
+                os.remove(filename)
+            except OSError:
+                continue
+            size -= entrySize
+
+    def fetchStopTime(self, msmID):
+        """
+        Fetches the description of measurement <msmID> and returns the time at which it stopped
+        :return:    the time (UNIX timestamp) at which the measurement stopped; None if it has not stopped yet (or if
+                    unknown)
+        """
+        is_success, description = rs.getScheduler().read(lambda: ac.getMeasurement(msmID))
+        if not is_success or not isinstance(description, dict):
+            return None
+        status = (description.get('status') or {}).get('name')
+        stopTime = description.get('stop_time')
+        if status is None or status in cm.RUNNING_STATUSES or not isinstance(stopTime, (int, float)):
+            return None
+        return stopTime
+
+    def getResults(self, msmID, start=None, stop=None, accept=None, stopTime=None):
+        """
+        Returns the results of measurement <msmID> between <start> and <stop>, from the cache if possible; otherwise
+        they are downloaded through the request scheduler and stored in the cache
+        :param accept:      see RequestScheduler.call
+        :param stopTime:    if != None, a time (UNIX timestamp) by which the caller knows that the measurement had
+                            stopped (for instance, the time at which it was reported finished). Otherwise, the status of
+                            the measurement is fetched, unless the cached entry already knows when it stopped
+        :return:            a tuple (<is_success>, <list of results>)
+        """
+        entry = self.lookup(msmID, start, stop)
+        if entry is not None and (accept is None or accept(entry['results'])):
+            if entry['final'] or (stop is not None and stop + self.settleDelay < entry['fetched']) \
+                    or time.time() - entry['fetched'] < self.revalidateAfter:
+                return True, entry['results']
+
+        if entry is not None and isinstance(entry.get('stopped'), (int, float)):
+            stopTime = entry['stopped'] if stopTime is None else min(stopTime, entry['stopped'])
+        if stopTime is None:
+            stopTime = self.fetchStopTime(msmID)
+
+        # the stop time is known before the results are downloaded: if the measurement had already settled, the
+        # results are complete
+        final = stopTime is not None and time.time() - stopTime >= self.settleDelay
+
+        is_success, results = rs.getScheduler().read(partial(ac.getResults, msmID, start=start, stop=stop), accept)
+        if not is_success or not isinstance(results, list):
+            if entry is not None:  # the API cannot be reached: the results we have are better than nothing
+                return True, entry['results']
+            return is_success, results
+
+        self.store(msmID, start, stop, results, final and len(results) > 0, stopTime)
+        return True, results
+
+
+def getCache():
+    """
+    Returns the cache shared by all the scripts, creating it with the default parameters if needed
+    :return:    the ResultCache object; None if the cache is disabled
+    """
+    global cache
+    with cacheLock:
+        if cache is None:
+            cache = ResultCache()
+            cache.prune()
+        return cache or None
+
+
+def configureCache(enabled=True, **kwargs):
+    """
+    Replaces the shared cache by one created with the parameters <kwargs> (see ResultCache), or disables it
+    """
+    global cache
+    with cacheLock:
+        cache = ResultCache(**kwargs) if enabled else False
+        if cache:
+            cache.prune()
+        return cache or None
+
+
+def getResults(msmID, start=None, stop=None, accept=None, stopTime=None):
+    """
+    Returns the results of measurement <msmID> between <start> and <stop>, reading through the shared cache if it is
+    enabled
+    :param accept:      see RequestScheduler.call
+    :param stopTime:    see ResultCache.getResults
+    :return:            a tuple (<is_success>, <list of results>)
+    """
+    resultCache = getCache()
+    if resultCache is None:
+        return rs.getScheduler().read(partial(ac.getResults, msmID, start=start, stop=stop), accept)
+    return resultCache.getResults(msmID, start, stop, accept, stopTime)
@@ -0,0 +1,112 @@
+# Author: Sarah Wassermann <sarah@wassermann.lu>
+
+"""
+This work is licensed under the Creative Commons Attribution-NoDerivatives 4.0 International License.
+To view a copy of this license, visit http://creativecommons.org/licenses/by-nd/4.0/ or send a letter to Creative Commons,
+PO Box 1866, Mountain View, CA 94042, USA.
+"""
+
+from __future__ import print_function
+
+import bz2
+import gzip
+import io
+import json
+
+
+# global vars - begin
+CHUNK_SIZE = 1 << 20    # number of characters read from a dump at once
+MAX_RECORD_SIZE = 16 * CHUNK_SIZE   # maximum number of characters of a record; beyond, the dump is considered corrupted
+SEPARATORS = ' \t\r\n,[]'
+# global vars - end
+
+
+def openDump(filename):
+    """
+    Opens a result-dump for reading; dumps whose name ends with '.gz' or '.bz2' are decompressed on the fly
+    :return:    a text file object
+    """
+    if filename.endswith('.gz'):
+        return io.TextIOWrapper(gzip.open(filename, 'rb'), encoding='utf-8')
+    if filename.endswith('.bz2'):
+        return io.TextIOWrapper(bz2.BZ2File(filename, 'rb'), encoding='utf-8')
+    return io.open(filename, 'r', encoding='utf-8')
+
+
+def iterDumpRecords(dumpFile):
+    """
+    Parses the records of a result-dump incrementally. The dump may either be a JSON array of results (as returned by
+    the RIPE Atlas API) or contain one result per line (NDJSON). Only the record being parsed and one chunk of the file
+    are held in memory
+    :param dumpFile:    a text file object
+    :return:            a generator of dictionaries, one per result
+    :raise ValueError:  if the dump is not valid JSON, or if no record could be decoded from MAX_RECORD_SIZE characters
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    endOfFile = False
+
+    while True:
+        # skip the whitespaces and the separators of the JSON array
+        while position < len(buffer) and buffer[position] in SEPARATORS:
+            position += 1
+
+        if position == len(buffer):
+            if endOfFile:
+                return
+            buffer = dumpFile.read(CHUNK_SIZE)
+            position = 0
+            endOfFile = not buffer
+            continue
+
+        try:
+            record, end = decoder.raw_decode(buffer, position)
+        except ValueError:  # the record continues in the next chunk
+            if endOfFile:
+                raise
+            if len(buffer) - position >= MAX_RECORD_SIZE:  # malformed record: do not buffer the rest of the dump
+                raise ValueError('no record could be decoded from ' + str(MAX_RECORD_SIZE) + ' characters')
+            chunk = dumpFile.read(CHUNK_SIZE)
+            endOfFile = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+
+        position = end
+        if isinstance(record, dict):
+            yield record
+        elif isinstance(record, list):  # an array of arrays of results
+            for element in record:
+                if isinstance(element, dict):
+                    yield element
+
+
+def iterResults(filename, types=None, verbose=False):
+    """
+    Streams the results stored in the dump <filename>
+    :param filename:    the name of the dump (JSON array or NDJSON, possibly compressed with gzip or bzip2)
+    :param types:       if != None, a tuple of result-types (e.g. ('traceroute',)): only the results of these types, or
+                        whose type is not indicated, are returned
+    :param verbose:     if true, an error message gets displayed when an internal problem occurs; otherwise not
+    :return:            a generator of dictionaries, one per result; None is yielded as last element if the dump
+                        could not be read
+    """
+    try:
+        dumpFile = openDump(filename)
+    except IOError:
+        if verbose:
+            print("error: Could not open file '" + filename + "'!\n")
+        yield None
+        return
+
+    try:
+        for record in iterDumpRecords(dumpFile):
+            if types is None or record.get('type', types[0]) in types:
+                yield record
+    except (IOError, EOFError, ValueError):
+        if verbose:
+            print("error: Could not parse file '" + filename + "'!\n")
+        yield None
+    finally:
+        dumpFile.close()
@@ -0,0 +1,85 @@
+# Author: Sarah Wassermann <sarah@wassermann.lu>
+
+"""
+This work is licensed under the Creative Commons Attribution-NoDerivatives 4.0 International License.
+To view a copy of this license, visit http://creativecommons.org/licenses/by-nd/4.0/ or send a letter to Creative Commons,
+PO Box 1866, Mountain View, CA 94042, USA.
+"""
+
+import heapq
+import math
+
+
+def toUnitVector(latitude, longitude):
+    """
+    Returns the point of the unit sphere corresponding to the coordinates <latitude>/<longitude> (in degrees). The
+    euclidean distance between two such points grows with the great-circle distance between the locations
+    :return:    a tuple (<x>, <y>, <z>)
+    """
+    lat = math.radians(latitude)
+    lon = math.radians(longitude)
+    return math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat)
+
+
+def squaredDistance(a, b):
+    """
+    Returns the squared euclidean distance between the points <a> and <b>
+    """
+    return (a[0] - b[0]) ** 2 + (a[1] - b[1]) ** 2 + (a[2] - b[2]) ** 2
+
+
+class KDTree:
+    """
+    This class represents a k-d tree over points of the unit sphere, each point holding a value. The tree is implicit:
+    the node of a range of the point list is the median of the range, the points before (after) it form its left
+    (right) subtree. It returns the values of the k points nearest to a location without scanning all the points
+    """
+    def __init__(self, points):
+        """
+        Builds the tree
+        :param points:  a list of tuples (<point>, <value>) where <point> is a tuple (<x>, <y>, <z>)
+        """
+        self.points = list(points)
+        self.build(0, len(self.points), 0)
+
+    def build(self, lo, hi, axis):
+        """
+        Arranges the points of the range [<lo>, <hi>[ so that they form a subtree split along the axis <axis>
+        """
+        while hi - lo > 1:
+            self.points[lo:hi] = sorted(self.points[lo:hi], key=lambda point: point[0][axis])
+            mid = (lo + hi) // 2
+            self.build(lo, mid, (axis + 1) % 3)
+            lo, axis = mid + 1, (axis + 1) % 3
+
+    def nearest(self, point, k):
+        """
+        Returns the values of the <k> points nearest to <point>
+        :param point:   a tuple (<x>, <y>, <z>)
+        :return:        a list of values, from the nearest point to the farthest one
+        """
+        if k <= 0:
+            return []
+
+        heap = []  # the k nearest points found so far, as tuples (-<squared distance>, <index>)
+        stack = [(0, len(self.points), 0)]
+        while stack:
+            lo, hi, axis = stack.pop()
+            if lo >= hi:
+                continue
+
+            mid = (lo + hi) // 2
+            nodePoint = self.points[mid][0]
+            distance = squaredDistance(point, nodePoint)
+            if len(heap) < k:
+                heapq.heappush(heap, (-distance, mid))
+            elif distance < -heap[0][0]:
+                heapq.heapreplace(heap, (-distance, mid))
+
+            delta = point[axis] - nodePoint[axis]
+            near, far = ((lo, mid), (mid + 1, hi)) if delta < 0 else ((mid + 1, hi), (lo, mid))
+            if len(heap) < k or delta * delta < -heap[0][0]:  # the far side may hold nearer points
+                stack.append((far[0], far[1], (axis + 1) % 3))
+            stack.append((near[0], near[1], (axis + 1) % 3))
+
+        return [self.points[idx][1] for _, idx in sorted(heap, reverse=True)]
@@ -17,18 +17,36 @@ import argparse
 import datetime
 import time
 import os
-import random
 import ipaddress
-from ripe.atlas.cousteau import Ping, AtlasSource, AtlasCreateRequest, AtlasResultsRequest, ProbeRequest
+import threading
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+try:
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue
+from functools import partial
+from ripe.atlas.cousteau import Ping, AtlasSource
 
 import disnetperf.AUX_IP_to_AS_map as IPToAS
 import disnetperf.AUX_probe_analysing as pa
 import disnetperf.AUX_check_measurements as cm
+import disnetperf.AUX_probe_catalogue as pc
+import disnetperf.AUX_psbox_cache as pcache
+import disnetperf.AUX_request_scheduler as rs
+import disnetperf.AUX_atlas_client as ac
+import disnetperf.AUX_result_cache as rc
+import disnetperf.AUX_result_dump as dump
 
 
 # global vars - begin
 probeToASMap = {}
 additionalInfoAboutMeasurements = {}
+
+NB_IN_FLIGHT_DEFAULT = 8        # default number of concurrent measurement-creation requests
+MAX_PINGS_PER_REQUEST = 20      # maximum number of ping measurements created through a single request
+NB_WORKERS_DEFAULT = 8          # default number of concurrent result downloads
+NB_NEAREST_DEFAULT = 50         # default maximum number of candidate boxes of a target whose location is known
 # global vars - end
 
 
@@ -45,78 +63,257 @@ def checkIP(ip):
         return False
 
 
-def getSmallestPingProbe(measurementIDsDict, outputFileName):
+def createPingMeasurements(job):
     """
-    Retrieves closest RIPE atlas boxes to target Ps and stores results
-    :param measurementIDsDict:  a dictionary whose keys are RIPE user-defined measurement (udm) IDs and the corresponding
-                                values are the targets of the UDMs
-    :param outputFileName:      name of the file which the results of the analysis should be written to.
-                                A line of the file has the format:
-                                "<target-IP> <RIPE probe ID> <RIPE probe IP> <RIPE probe AS> <min RTT> <Label> "
-                                <Label> is [RANDOM] when the candidate-boxes have been selected randomly,
-                                [NO_AS] if no AS could be associated to the target-IP and [OK] if the candidate boxes were
-                                found either in the same AS as the target IP or in neighbour ASes
-    :return: a dictionary whose keys are target IPs and values are tuples in the form (<probeID>, <probeIP>, <probeAS>, <minRTT>)
+    Creates, in a single request, one ping measurement towards each target of a batch; all the measurements use the
+    same probes. The request goes through the shared request scheduler, which retries it when it fails or when the
+    response does not hold one measurement ID per target. If RIPE Atlas rejects the request (for instance because one
+    of the targets is invalid), the measurement towards each target is created through a request of its own
+    :param job: a tuple (<IPs>, <probes>) where <IPs> is the list of targets and <probes> a list of probe IDs
+    :return:    a tuple (<IPs>, <list of created measurement IDs>) where the i-th measurement ID corresponds to the i-th
+                target and is None if the measurement towards that target could not be created. The list is None if no
+                measurement could be created
     """
-    IPToPSBoxMap = {}
-    for IP in measurementIDsDict:
-        UDMs = measurementIDsDict[IP]
-        pingMeasurements = []
+    IPs, probesToUse = job
+
+    pings = []
+    for IP in IPs:
+        description = "Ping target={target}".format(target=IP)
+        pings.append(Ping(af=4, target=IP, description=description, protocol="ICMP", packets=10))
+    source = AtlasSource(type="probes", value=','.join(map(str, probesToUse)), requested=len(probesToUse))
+    request = partial(ac.createMeasurements, API_KEY, pings, [source], is_oneoff=True)
+
+    def isComplete(response):
+        return isinstance(response, dict) and isinstance(response.get('measurements'), list) \
+            and len(response['measurements']) == len(IPs)
+
+    (is_success, response) = rs.getScheduler().create(request, accept=isComplete)
+
+    if is_success and isComplete(response):
+        return IPs, response['measurements']
+    if not is_success and len(IPs) > 1 and rs.isRejected(response):
+        UDMs = []
+        for IP in IPs:
+            _, created = createPingMeasurements(([IP], probesToUse))
+            UDMs.append(created[0] if created is not None else None)
+        if any(udm is not None for udm in UDMs):
+            return IPs, UDMs
+    return IPs, None
+
+
+def createTargetMeasurements(IP, probes):
+    """
+    Creates the ping measurements towards the target <IP> from the candidate boxes <probes>
+    :param probes:  a list of lists of probe IDs (one measurement per list)
+    :return:        a tuple (<IP>, <list of created measurement IDs>). The list is None if no measurement could be
+                    created
+    """
+    UDMs = []
+    for probesToUse in probes:
+        _, created = createPingMeasurements(([IP], probesToUse))
+        if created is not None:
+            UDMs.extend(created)
+    return IP, UDMs or None
 
-        for udm in UDMs:
-            for _ in range(5):
-                is_success, resultInfo = AtlasResultsRequest(msm_id=udm).create()
 
-                if is_success and resultInfo:
-                    break
-                else:
-                    time.sleep(30)
-            else:
-                print("Can't get udm-results...\n")
+def fetchSmallestPing(job):
+    """
+    Downloads the results of a ping measurement and reduces them to the reply with the smallest RTT
+    :param job: a tuple (<target-IP>, <udm>)
+    :return:    a tuple (<target-IP>, <udm>, <best>) where <best> is a tuple (<probe ID>, <probe IP>, <min RTT>), or None if
+                no probe could reach the target or the results could not be downloaded
+    """
+    IP, udm = job
+    # results of a finished measurement may take a moment to be available: retry while the response is empty
+    try:
+        # the poller reported the measurement finished: it stopped by now, and its status need not be fetched
+        is_success, resultInfo = rc.getResults(udm, accept=bool, stopTime=time.time())
+    except Exception:  # unexpected problem while downloading: only the results of this UDM are missing
+        is_success, resultInfo = False, None
+    if not is_success or not resultInfo:
+        print("Can't get udm-results...\n")
+        return IP, udm, None
+
+    best = None
+    for line in resultInfo:
+        try:
+            if line['src_addr'] == line['dst_addr']:
                 continue
 
-            if not resultInfo:
-                continue
+            if line['min'] != '*' and line['min'] >= 0 and (best is None or line['min'] < best[2]):
+                best = (line['prb_id'], line['from'], line['min'])  # probe's ID/IP/RTT
+        except (KeyError, TypeError):  # malformed result: skip it
+            continue
+    return IP, udm, best
+
+
+def iterSmallestPingProbes(measurementIDsDict, nbWorkers=NB_WORKERS_DEFAULT):
+    """
+    Downloads the results of the UDMs of all the targets concurrently and keeps a running minimum per target
+    :param measurementIDsDict:  a dictionary whose keys are target IPs and values are lists of the IDs of the ping
+                                measurements launched towards them
+    :param nbWorkers:           the number of results downloaded concurrently
+    :return:                    a generator of tuples (<target-IP>, <best>), yielded as soon as all the UDMs of a target
+                                have been processed. <best> is a tuple (<probe ID>, <probe IP>, <min RTT>) or None if the
+                                target is unreachable
+    """
+    remaining = {}
+    bestPerIP = {}
+    jobs = []
+    for IP in measurementIDsDict:
+        remaining[IP] = len(measurementIDsDict[IP])
+        bestPerIP[IP] = None
+        jobs.extend((IP, udm) for udm in measurementIDsDict[IP])
 
-            for line in resultInfo:
-                srcIP = line['src_addr']
-                destIP = line['dst_addr']
+    if not jobs:
+        return
+
+    pool = ThreadPool(max(1, min(nbWorkers, len(jobs))))
+    try:
+        for IP, _, best in pool.imap_unordered(fetchSmallestPing, jobs):
+            if best is not None and (bestPerIP[IP] is None or best[2] < bestPerIP[IP][2]):
+                bestPerIP[IP] = best
 
-                if srcIP == destIP:
+            remaining[IP] -= 1
+            if remaining[IP] == 0:
+                yield IP, bestPerIP.pop(IP)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def selectCandidateProbes(catalogue, probeIDs, location, nbNearest, parsedCandidates):
+    """
+    Returns the candidate boxes of a target among the boxes <probeIDs>, split as expected by createPingMeasurements
+    :param catalogue:           the probe catalogue
+    :param probeIDs:            the IDs of the boxes the candidate boxes are chosen among
+    :param location:            if != None, a tuple (<latitude>, <longitude>) locating the target: only the <nbNearest>
+                                boxes geographically nearest to it are kept
+    :param nbNearest:           the maximum number of candidate boxes of a located target
+    :param parsedCandidates:    a dictionary memoizing the lists of candidate boxes already split
+    :return:                    a list of lists of probe IDs ('' if there is no candidate box); None if a problem occurred
+    """
+    if location is not None and len(probeIDs) > nbNearest:
+        probeIDs = catalogue.nearestProbes(location[0], location[1], nbNearest, probeIDs)
+
+    key = tuple(probeIDs)
+    if key not in parsedCandidates:
+        parsedCandidates[key] = pa.parseProbeListOutput(catalogue.describe(probeIDs), True, probeToASMap)
+    return parsedCandidates[key]
+
+
+def loadTargetLocations(filename, verbose):
+    """
+    Loads the locations of targets from the file <filename>
+    :param filename:    a file whose lines have the format <IP> <latitude> <longitude> (separated by whitespaces)
+    :param verbose:     if true, an error message gets displayed when an internal problem occurs; otherwise not
+    :return:            a dictionary whose keys are IPs and values are tuples (<latitude>, <longitude>); None if a problem
+                        occurred
+    """
+    locations = {}
+    try:
+        with open(filename, 'r') as locationFile:
+            for line in locationFile:
+                data = line.split()
+                if not data:
                     continue
+                locations[data[0]] = (float(data[1]), float(data[2]))
+    except (IOError, ValueError, IndexError):
+        if verbose:
+            print("error: Could not load file '" + filename + "'\n")
+        return None
+    return locations
 
-                if line['min'] != '*':
-                    pingMeasurements.append((line['prb_id'], line['from'], line['min']))  # probe's ID/IP/RTT
 
-        if not pingMeasurements:  # target unreachable
-            continue
-        probeMinRTT = min(pingMeasurements, key=lambda tup: tup[2])
+def labelOfClosestBox(label, targetAS, probeAS):
+    """
+    Returns the label of a target whose closest box has been found. A target mapped to an AS whose candidate boxes were
+    not chosen from this AS ([RANDOM] or [DUMP]) is labelled [OK] if its closest box is located in its AS
+    :param label:       the label given to the target when its candidate boxes were chosen
+    :param targetAS:    the AS the target is located in ('NA_MAP' if unknown)
+    :param probeAS:     the AS the closest box is located in (None if unknown)
+    :return:            the label of the target
+    """
+    if label in ('[RANDOM]', '[DUMP]') and targetAS != 'NA_MAP' and probeAS is not None \
+            and str(probeAS) == str(targetAS):
+        return '[OK]'
+    return label
+
+
+def writePSBox(IP, probeMinRTT, outputFile):
+    """
+    Writes the closest box to the IP <IP> to the output-file <outputFile>
+    :param IP:          the target IP
+    :param probeMinRTT: a tuple (<probe ID>, <probe IP>, <min RTT>) describing the closest box
+    :param outputFile:  the file the line "<target-IP> <RIPE probe ID> <RIPE probe IP> <RIPE probe AS> <min RTT> <Label>"
+                        should be written to
+    :return:            a tuple (<probeID>, <probeIP>, <probeAS>, <minRTT>)
+    """
+    outputFile.write(IP + '\t' + str(probeMinRTT[0]) + '\t' + str(probeMinRTT[1]) + '\t'
+                     + str(probeToASMap[probeMinRTT[0]]) + '\t' + str(probeMinRTT[2]) + '\t'
+                     + str(additionalInfoAboutMeasurements[IP]) + '\n')
 
-        outputFileName.write(IP + '\t' + str(probeMinRTT[0]) + '\t' + str(probeMinRTT[1]) + '\t'
-                             + str(probeToASMap[probeMinRTT[0]]) + '\t' + str(probeMinRTT[2]) + '\t'
-                             + str(additionalInfoAboutMeasurements[IP]) + '\n')
+    return probeMinRTT[0], probeMinRTT[1], probeToASMap[probeMinRTT[0]], str(probeMinRTT[2])
 
-        IPToPSBoxMap[IP] = (probeMinRTT[0], probeMinRTT[1], probeToASMap[probeMinRTT[0]], str(probeMinRTT[2]))
+
+def getSmallestPingProbe(measurementIDsDict, outputFileName, nbWorkers=NB_WORKERS_DEFAULT):
+    """
+    Retrieves closest RIPE atlas boxes to target Ps and stores results
+    :param measurementIDsDict:  a dictionary whose keys are RIPE user-defined measurement (udm) IDs and the corresponding
+                                values are the targets of the UDMs
+    :param outputFileName:      name of the file which the results of the analysis should be written to.
+                                A line of the file has the format:
+                                "<target-IP> <RIPE probe ID> <RIPE probe IP> <RIPE probe AS> <min RTT> <Label> "
+                                <Label> is [RANDOM] when the candidate-boxes have been selected randomly,
+                                [NO_AS] if no AS could be associated to the target-IP, [PREFIX] if the candidate boxes
+                                share the most specific covering prefix with the target IP and [OK] if the candidate boxes
+                                were found either in the same AS as the target IP or in neighbour ASes
+    :param nbWorkers:           the number of results downloaded concurrently
+    :return: a dictionary whose keys are target IPs and values are tuples in the form (<probeID>, <probeIP>, <probeAS>, <minRTT>)
+    """
+    IPToPSBoxMap = {}
+    for IP, probeMinRTT in iterSmallestPingProbes(measurementIDsDict, nbWorkers):
+        if probeMinRTT is None:  # target unreachable
+            continue
+
+        IPToPSBoxMap[IP] = writePSBox(IP, probeMinRTT, outputFileName)
 
     return IPToPSBoxMap
 
 
-def find_psboxes(IPs, verbose, recovery=False):
+def iter_psboxes(IPs, verbose, recovery=False, refreshProbes=False, nbInFlight=NB_IN_FLIGHT_DEFAULT, cacheTTL=0,
+                 cacheFallback=pcache.FALLBACK_NONE, samePrefixFirst=True, targetLocations=None,
+                 nbNearest=NB_NEAREST_DEFAULT):
     """
-    Finds the closest box to each IP in <IPs>, displays the results on the screen and stores them in a file in the
-    'output' folder and whose naming-scheme is '<timestamp_of_creation_time>_psbox.txt'
+    Finds the closest box to each IP in <IPs> and yields it as soon as the measurements towards that IP finished.
+    Each result is also appended to a file in the 'output' folder whose naming-scheme is
+    '<timestamp_of_creation_time>_psbox.txt' as soon as it is known
     :param IPs:      a list containing all the IPs a closest box should be found to
     :param verbose:  if true, an error message gets displayed when an internal problem occurs; otherwise not
     :param recovery: if true, the recovery mode will be enabled (for more info, please see the docs in the folder
                      'doc')
-    :return:         a dictionary whose values are the IPs and the keys are the corresponding closest boxes. If there
-                     is no entry for a given IP, no box has been found
+    :param refreshProbes: if true, the probe catalogue is refreshed through the RIPE Atlas API in the background
+    :param nbInFlight: the maximum number of measurement-creation requests that are sent concurrently
+    :param cacheTTL: if > 0, closest boxes found less than <cacheTTL> seconds ago (in this or a previous run) are taken
+                     from the closest-box cache instead of being measured again. The closest boxes found are recorded
+                     in the cache whatever the value of <cacheTTL>
+    :param cacheFallback: which cache entries may be used for an IP: FALLBACK_NONE (same IP), FALLBACK_PREFIX (same
+                     IP or covering prefix) or FALLBACK_AS (same IP, covering prefix or AS)
+    :param samePrefixFirst: if true, the candidate boxes of an IP are the boxes sharing its most specific covering
+                     prefix, if there are any; the boxes of its AS or of the neighbour ASes are only used otherwise
+    :param targetLocations: if != None, a dictionary whose keys are IPs and values are tuples (<latitude>, <longitude>)
+                     locating them. The candidate boxes of a located IP are limited to the <nbNearest> ones
+                     geographically nearest to it, which are also used instead of random boxes
+    :param nbNearest: the maximum number of candidate boxes of a located IP
+    :return:         a generator of tuples (<IP>, (<probeID>, <probeIP>, <probeAS>, <minRTT>)). No tuple is yielded
+                     for an IP if no box has been found. If an internal problem occurs, None is yielded and the
+                     generator stops
     """
 
     currentTime = datetime.datetime.fromtimestamp(time.time()).strftime('%Y-%m-%d-%H-%M-%S')
-    measurementIDs = set()
     IPsToMeasurementIDs = {}
     IPsAlreadyAnalysed = set()
+    fallbacks = {}  # keys: IPs pinged from the boxes of their prefix; values: tuples (<other candidate boxes>, <label>)
 
     if recovery:  # recovery mode enabled
         # recover ID-to-AS mapping that has been done so far - begin
@@ -125,13 +322,14 @@ def find_psboxes(IPs, verbose, recovery=False):
         except IOError:
             if verbose:
                 print("error: Could not open/create file '../logs/ID_To_AS.log'\n")
-            return None
+            yield None
+            return
 
         for line in ASMap:
             line = line.rstrip('\r\n')
             if line:
                 data = line.split('\t')
-                probeToASMap[data[0]] = data[1]
+                probeToASMap[int(data[0])] = data[1]
         ASMap.close()
         # recover ID-to-AS mapping that has been done so far - end
 
@@ -141,7 +339,8 @@ def find_psboxes(IPs, verbose, recovery=False):
         except IOError:
             if verbose:
                 print("error: Could not open file '../logs/current_ping_measurementIDs.log'\n")
-            return None
+            yield None
+            return
 
         cnt = 0
         timeStamp = ''
@@ -152,8 +351,16 @@ def find_psboxes(IPs, verbose, recovery=False):
                     timeStamp = line
                 else:
                     data = line.split('\t')
-                    IPsToMeasurementIDs[data[-2]] = data[:-2]
-                    measurementIDs.update(data[:-2])
+                    if data[0] == 'FALLBACK':  # other candidate boxes of a target pinged from the boxes of its prefix
+                        fallbacks[data[1]] = ([probesToUse.split(',') for probesToUse in data[3:]], data[2])
+                        cnt += 1
+                        continue
+                    if data[-1] != '[PREFIX]':  # the other candidate boxes have already been pinged
+                        fallbacks.pop(data[-2], None)
+                    if data[-2] in IPsToMeasurementIDs and additionalInfoAboutMeasurements[data[-2]] == data[-1]:
+                        IPsToMeasurementIDs[data[-2]].extend(data[:-2])  # another request towards the same target
+                    else:
+                        IPsToMeasurementIDs[data[-2]] = data[:-2]
                     additionalInfoAboutMeasurements[data[-2]] = data[-1]
                     IPsAlreadyAnalysed.add(data[-2])
                 cnt += 1
@@ -166,9 +373,23 @@ def find_psboxes(IPs, verbose, recovery=False):
         except IOError:
             if verbose:
                 print("error: Could not open/create file '../logs/ID_To_AS.log'\n")
-            return None
+            yield None
+            return
         ASMap.close()
 
+    # recover closest boxes already written to the output-file - begin
+    IPsAlreadyFound = {}
+    if recovery:
+        try:
+            with open('../output/' + str(timeStamp) + '_psbox.txt', 'r') as previousOutput:
+                for line in previousOutput:
+                    data = line.rstrip('\r\n').split('\t')
+                    if len(data) == 6:
+                        IPsAlreadyFound[data[0]] = (int(data[1]), data[2], data[3], data[4])
+        except IOError:
+            pass
+    # recover closest boxes already written to the output-file - end
+
     # open/create output-file - begin
     try:
         if recovery:
@@ -181,7 +402,8 @@ def find_psboxes(IPs, verbose, recovery=False):
                 print("error: Could not open/create file '../output/" + str(timeStamp) + "_psbox.txt'\n")
             else:
                 print("error: Could not open/create file '../output/" + currentTime + "_psbox.txt'\n")
-        return None
+        yield None
+        return
     # open/create output-file - end
 
     # open/create log-file - begin
@@ -194,25 +416,20 @@ def find_psboxes(IPs, verbose, recovery=False):
     except IOError:
         if verbose:
             print("error: Could not open/create file '../logs/current_ping_measurementIDs.log'\n")
-        return None
+        yield None
+        return
     # open/create log-file - end
 
-    # open file containing RIPE Atlas boxes and load data - begin
-    try:
-        with open('../lib/probelist.txt', 'r') as plFile:
-            probeList = []  # load list with all currently connected RIPE probes
-            for line in plFile:
-                line = line.rstrip('\r\n')
-                if line:
-                    probeData = line.split('\t')
-                    probeList.append((probeData[0], probeData[3]))
-    except IOError:
-        if verbose:
-            print("error: Could not open file '../lib/probelist.txt'\n")
+    # load catalogue of currently connected RIPE Atlas boxes - begin
+    catalogue = pc.loadProbeCatalogue(verbose)
+    if catalogue is None:
         output.close()
         logFile.close()
-        return None
-    # open file containing RIPE Atlas boxes and load data - end
+        yield None
+        return
+    if refreshProbes:
+        catalogue.startBackgroundRefresh(verbose)
+    # load catalogue of currently connected RIPE Atlas boxes - end
 
     targetIPs = list(IPs)
 
@@ -221,157 +438,353 @@ def find_psboxes(IPs, verbose, recovery=False):
     if IPToASMap is None:
         output.close()
         logFile.close()
-        return None
+        yield None
+        return
+
+    # load closest-box cache - begin
+    # the closest boxes found are always recorded; they are only taken from the cache if <cacheTTL> is > 0
+    cache = pcache.PSBoxCache(cacheTTL, cacheFallback)
+    if cache.load() is None:
+        if verbose:
+            print("error: Could not load file '" + cache.filename + "'\n")
+        output.close()
+        logFile.close()
+        yield None
+        return
+    # load closest-box cache - end
+
+    IPsAlreadyAnalysed.update(IPsAlreadyFound)
 
-    encounteredASes = {}
+    encounteredASes = {}   # keys: ASes; values: the IDs of the boxes in the AS or in its neighbour ASes
+    parsedCandidates = {}
+    targetsToMeasure = []  # list of tuples (<IP>, <list of lists of candidate probe IDs>)
 
-    # launching measurements to find closest box - start
+    # selecting candidate boxes - start
     for IP in IPToASMap:
         if IP in IPsAlreadyAnalysed:
             continue
         IPsAlreadyAnalysed.add(IP)
+        AS = IPToASMap[IP]
+
+        cachedBox = cache.lookup(IP, AS)
+        if cachedBox is not None:  # fresh closest box found in the cache; no measurement needed
+            probeToASMap[cachedBox[0]] = cachedBox[2]
+            additionalInfoAboutMeasurements[IP] = cachedBox[4]
+            yield IP, writePSBox(IP, (cachedBox[0], cachedBox[1], cachedBox[3]), output)
+            continue
 
         if verbose:
-            print('Starting to do measurements for IP: ' + IP + '...\n')
-        AS = IPToASMap[IP]
+            print('Selecting candidate boxes for IP: ' + IP + '...\n')
+
+        location = targetLocations.get(IP) if targetLocations is not None else None
+
+        # the boxes sharing the most specific covering prefix with IP are the most likely to be the closest ones
+        prefixProbes = ''
+        samePrefix = catalogue.probesInPrefix(IP) if samePrefixFirst else None
+        if samePrefix is not None:
+            prefixProbes = selectCandidateProbes(catalogue, samePrefix[1], location, nbNearest, parsedCandidates)
+            if prefixProbes is None:
+                output.close()
+                logFile.close()
+                yield None
+                return
 
         if AS == 'NA_MAP':
             additionalInfoAboutMeasurements[IP] = '[NO_AS]'
-            idx = random.sample(range(len(probeList)), 100)
-            selectedProbes = [probeList[i][0] for i in idx]
-
-            for i in idx:
-                probeToASMap[probeList[i][0]] = probeList[i][1]
-
-            try:
-                with open('../logs/ID_To_AS.log', 'a', 0) as ASMap:
-                    for i in idx:
-                        ASMap.write(probeList[i][0] + '\t' + probeList[i][1] + '\n')
-            except IOError:
-                if verbose:
-                    print("error: Could not open/create file '../logs/ID_To_AS.log'\n")
+            probes = ''
+        else:
+            if AS not in encounteredASes:  # check whether we have already retrieved probes for this AS
+                # check whether there are probes in IP's AS; if not, look at the closest ASes of its neighbourhood
+                neighbours = []
+                if not catalogue.nbProbesInAS(AS):
+                    neighbours = pa.findRankedASNeighbourhood(AS, True, catalogue.nbProbesInAS)
+                    if neighbours is None:
+                        output.close()
+                        logFile.close()
+                        yield None
+                        return
+                encounteredASes[AS] = catalogue.candidateProbes(AS, neighbours)
+
+            probes = selectCandidateProbes(catalogue, encounteredASes[AS], location, nbNearest, parsedCandidates)
+            if probes is None:
                 output.close()
                 logFile.close()
-                return None
-
-            probes = [selectedProbes[i:i + 500] for i in range(len(selectedProbes), 500)]
-
-        elif AS not in encounteredASes:  # check whether we have already retrieved probes for this AS
-            # check whether there are probes in IP's AS
-            probes = list(ProbeRequest(asn=IPToASMap[IP]))
-            # TODO: what if problem in executing request?
-
-            # if not, look at the neighbour ASes
-            if not probes:
-                neighbours = pa.findASNeighbourhood(IPToASMap[IP], True)
-                if neighbours is None:
-                    output.close()
-                    logFile.close()
-                    return None
-
-                for neighbour in neighbours:
-                    probes = list(ProbeRequest(asn=neighbour))
-            # TODO: what if problem in executing request?
-
-            if probes:  # we have found neighbouring probes
-                probes = pa.parseProbeListOutput(probes, True, probeToASMap)
-                if probes is None:
-                    output.close()
-                    logFile.close()
-                    return None
-
-                encounteredASes[AS] = probes
-            else:
-                encounteredASes[AS] = ''
-
-        # pinging neighbours - start
-        if AS != 'NA_MAP':
-            probes = encounteredASes[AS]
-
-        if not probes:  # if no probes in neighbourhood, use randomly selected probes
-            additionalInfoAboutMeasurements[IP] = '[RANDOM]'
-
-            idx = random.sample(range(len(probeList)), 100)
-            selectedProbes = [probeList[i][0] for i in idx]
-
-            for i in idx:
-                probeToASMap[probeList[i][0]] = probeList[i][1]
+                yield None
+                return
+            additionalInfoAboutMeasurements[IP] = '[OK]' if probes else '[RANDOM]'
 
-            try:
-                with open('../logs/ID_To_AS.log', 'a', 0) as ASMap:
-                    for i in idx:
-                        ASMap.write(probeList[i][0] + '\t' + probeList[i][1] + '\n')
-            except IOError:
-                if verbose:
-                    print("error: Could not open/create file '../logs/ID_To_AS.log'\n")
+        if not probes:  # no AS or no probes in neighbourhood: use the boxes nearest to IP if located, random ones otherwise
+            if location is not None:
+                probeIDs = catalogue.nearestProbes(location[0], location[1], nbNearest)
+            else:
+                probeIDs = catalogue.sampleProbes(100)
+            probes = selectCandidateProbes(catalogue, probeIDs, None, nbNearest, parsedCandidates)
+            if probes is None:
                 output.close()
                 logFile.close()
-                return None
+                yield None
+                return
+
+        if prefixProbes:  # the other candidate boxes are only pinged if none of the boxes of IP's prefix reaches IP
+            pinged = set(ID for probesToUse in prefixProbes for ID in probesToUse)
+            otherProbes = [[ID for ID in probesToUse if ID not in pinged] for probesToUse in probes]
+            otherProbes = [probesToUse for probesToUse in otherProbes if probesToUse]
+            if otherProbes:
+                fallbacks[IP] = (otherProbes, additionalInfoAboutMeasurements[IP])
+            additionalInfoAboutMeasurements[IP] = '[PREFIX]'
+            probes = prefixProbes
+
+        targetsToMeasure.append((IP, probes))
+    # selecting candidate boxes - end
+
+    # pinging candidate boxes and computing closest boxes as soon as the measurements towards a target finished - start
+    # targets sharing the same candidate boxes are pinged through the same requests (one measurement per target)
+    targetsPerCandidates = OrderedDict()
+    for IP, probes in targetsToMeasure:
+        targetsPerCandidates.setdefault(tuple(tuple(probesToUse) for probesToUse in probes), []).append(IP)
+
+    jobs = []
+    for candidates in targetsPerCandidates:
+        IPs = targetsPerCandidates[candidates]
+        for probesToUse in candidates:
+            jobs.extend((IPs[i:i + MAX_PINGS_PER_REQUEST], probesToUse)
+                        for i in range(0, len(IPs), MAX_PINGS_PER_REQUEST))
+
+    for IP in IPsAlreadyFound:
+        yield IP, IPsAlreadyFound[IP]
+
+    # keys: IPs; values: the number of creation requests and of unfinished measurements towards them. The results
+    # towards an IP are only retrieved once it drops to 0
+    remaining = {}
+    UDMsToIP = {}
+    for IP in IPsToMeasurementIDs:  # measurements recovered from the log-file
+        if IP in IPsAlreadyFound:
+            continue
+        remaining[IP] = len(IPsToMeasurementIDs[IP])
+        for udm in IPsToMeasurementIDs[IP]:
+            UDMsToIP[udm] = IP
+    for IP, probes in targetsToMeasure:
+        IPsToMeasurementIDs[IP] = []
+        remaining[IP] = len(probes)
+
+    events = queue.Queue()
+    poller = cm.MeasurementPoller(UDMsToIP, True)
+    stopPolling = threading.Event()
+
+    def pollMeasurements():
+        # the measurements are polled as soon as they are created; a terminal event is posted if a status cannot be
+        # checked, so that the loop below never waits forever
+        try:
+            for udm in poller.iterFinished(lambda: not stopPolling.is_set()):
+                events.put(('finished', udm))
+        except Exception:
+            events.put(('finished', None))  # status could not be checked
 
-            probes = [list(map(int, selectedProbes[i:i + 500])) for i in range(len(selectedProbes), 500)]
-        elif AS != 'NA_MAP':
-            additionalInfoAboutMeasurements[IP] = '[OK]'
+    def runAndPost(event, function, args, failure):
+        # runs in a worker of a pool; an event is always posted, even if <function> raises an exception
+        try:
+            result = function(*args)
+        except Exception:
+            result = failure
+        events.put((event, result))
+
+    def measurementsCreated(IP, UDMs):
+        # each measurement is logged as soon as it exists, so that it is also analysed in recovery mode
+        if not IPsToMeasurementIDs[IP] and IP in fallbacks:
+            otherProbes, label = fallbacks[IP]
+            logFile.write('FALLBACK\t' + IP + '\t' + label + '\t'
+                          + '\t'.join(','.join(map(str, probesToUse)) for probesToUse in otherProbes) + '\n')
+        logFile.write('\t'.join(map(str, UDMs)) + '\t' + IP + '\t' + additionalInfoAboutMeasurements[IP] + '\n')
+
+        IPsToMeasurementIDs[IP].extend(UDMs)
+        remaining[IP] += len(UDMs)
+        for udm in UDMs:
+            UDMsToIP[udm] = IP
+        poller.add(UDMs)
+
+    def measurementDone(IP):
+        # called once per creation request and once per finished measurement towards IP
+        remaining[IP] -= 1
+        if remaining[IP] > 0:
+            return
+        del remaining[IP]
+        if not IPsToMeasurementIDs[IP]:  # no measurement could be created: IP is not analysed
+            return
 
-        giveUp = False
+        if verbose:
+            print('Computing closest RIPE Atlas box for IP: ' + IP + '...\n')
+        pendingResults[IP] = len(IPsToMeasurementIDs[IP])
+        bestPerIP[IP] = None
+        for udm in IPsToMeasurementIDs[IP]:
+            pool.apply_async(runAndPost, ('result', fetchSmallestPing, ((IP, udm),), (IP, udm, None)))
+
+    if verbose:
+        print('Waiting for ping measurements to finish...\n')
+
+    pollThread = threading.Thread(target=pollMeasurements)
+    pollThread.daemon = True
+    pollThread.start()
 
-        for probesToUse in probes:
-            for _ in range(5):  # Perform at most 5 tries before giving up.
-                description = "Ping target={target}".format(target=IP)
-                ping = Ping(af=4, target=IP, description=description, protocol="ICMP", packets=10)
-                source = AtlasSource(type="probes", value=','.join(map(str, probesToUse)), requested=len(probesToUse))
-                request = AtlasCreateRequest(key=API_KEY, measurements=[ping], sources=[source], is_oneoff=True)
+    creationPool = ThreadPool(max(1, nbInFlight))
+    for job in jobs:
+        creationPool.apply_async(runAndPost, ('created', createPingMeasurements, (job,), (job[0], None)))
 
-                (is_success, response) = request.create()
+    pool = ThreadPool(NB_WORKERS_DEFAULT)
+    pendingResults = {}
+    bestPerIP = {}
 
-                if is_success and 'measurements' in response:
-                    if IP not in IPsToMeasurementIDs:
-                        IPsToMeasurementIDs[IP] = [response['measurements'][0]]
+    try:
+        while remaining or pendingResults:
+            event, data = events.get()
+
+            if event == 'created':  # a request creating one measurement per target returned
+                IPs, UDMs = data
+                for i, IP in enumerate(IPs):
+                    if UDMs is None or UDMs[i] is None:
+                        if verbose:
+                            print('error: Could not create ping measurements for IP: ' + IP + '\n')
                     else:
-                        IPsToMeasurementIDs[IP].append(response['measurements'][0])
-                    measurementIDs.add(response['measurements'][0])
-                    break
+                        measurementsCreated(IP, [UDMs[i]])
+                    measurementDone(IP)
+            elif event == 'fallback':  # the measurements towards the other candidate boxes of a target were created
+                IP, UDMs = data
+                if UDMs is None:
+                    if verbose:
+                        print('error: Could not create ping measurements for IP: ' + IP + '\n')
                 else:
-                    time.sleep(180)
+                    measurementsCreated(IP, UDMs)
+                measurementDone(IP)
+            elif event == 'finished':
+                if data is None:  # status could not be checked
+                    yield None
+                    return
+                measurementDone(UDMsToIP[data])
             else:
-                giveUp = True
-                IPsToMeasurementIDs.pop(IP, None)  # delete this entry; should not be analyzed
-                break
-        if giveUp:
-            break
+                IP, _, best = data
+                if best is not None and (bestPerIP[IP] is None or best[2] < bestPerIP[IP][2]):
+                    bestPerIP[IP] = best
+
+                pendingResults[IP] -= 1
+                if pendingResults[IP] == 0:
+                    del pendingResults[IP]
+                    probeMinRTT = bestPerIP.pop(IP)
+                    if probeMinRTT is not None:  # target reachable
+                        fallbacks.pop(IP, None)
+                        additionalInfoAboutMeasurements[IP] = labelOfClosestBox(additionalInfoAboutMeasurements[IP],
+                                                                                IPToASMap.get(IP, 'NA_MAP'),
+                                                                                probeToASMap.get(probeMinRTT[0]))
+                        closestBox = writePSBox(IP, probeMinRTT, output)
+                        cache.add(IP, IPToASMap.get(IP, 'NA_MAP'), closestBox, additionalInfoAboutMeasurements[IP])
+                        yield IP, closestBox
+                    elif IP in fallbacks:  # none of the boxes of IP's prefix reached IP: ping the other candidates
+                        probes, additionalInfoAboutMeasurements[IP] = fallbacks.pop(IP)
+                        if verbose:
+                            print('Pinging the other candidate boxes for IP: ' + IP + '...\n')
+                        IPsToMeasurementIDs[IP] = []
+                        remaining[IP] = 1
+                        pool.apply_async(runAndPost, ('fallback', createTargetMeasurements, (IP, probes), (IP, None)))
+    finally:
+        stopPolling.set()
+        creationPool.terminate()
+        pool.terminate()
+        output.close()
+        logFile.close()
+        if cache.save() is None and verbose:
+            print("error: Could not write file '" + cache.filename + "'\n")
+    # pinging candidate boxes and computing closest boxes as soon as the measurements towards a target finished - end
+    # os.remove('../logs/current_ping_measurementIDs.log')
+    # if os.path.exists('../logs/ID_To_AS.log'):
+    #     os.remove('../logs/ID_To_AS.log')
 
-        if IPsToMeasurementIDs[IP]:
-            logFile.write('\t'.join(map(str, IPsToMeasurementIDs[IP])) + '\t' + IP + '\t'
-                                    + additionalInfoAboutMeasurements[IP] + '\n')
-        # pinging neighbours - end
 
-    # launching measurements to find closest box - end
-    logFile.close()
+def find_psboxes(IPs, verbose, recovery=False, refreshProbes=False, nbInFlight=NB_IN_FLIGHT_DEFAULT, callback=None,
+                 cacheTTL=0, cacheFallback=pcache.FALLBACK_NONE, samePrefixFirst=True, targetLocations=None,
+                 nbNearest=NB_NEAREST_DEFAULT):
+    """
+    Finds the closest box to each IP in <IPs>, displays the results on the screen and stores them in a file in the
+    'output' folder and whose naming-scheme is '<timestamp_of_creation_time>_psbox.txt'
+    :param IPs:      a list containing all the IPs a closest box should be found to
+    :param verbose:  if true, an error message gets displayed when an internal problem occurs; otherwise not
+    :param recovery: if true, the recovery mode will be enabled (for more info, please see the docs in the folder
+                     'doc')
+    :param refreshProbes: if true, the probe catalogue is refreshed through the RIPE Atlas API in the background
+    :param nbInFlight: the maximum number of measurement-creation requests that are sent concurrently
+    :param callback: if != None, called with the arguments (<IP>, <closest box>) as soon as the closest box to an IP
+                     is known
+    :param cacheTTL: if > 0, closest boxes found less than <cacheTTL> seconds ago are taken from the closest-box cache
+    :param cacheFallback: which cache entries may be used for an IP (see iter_psboxes)
+    :param samePrefixFirst: if true, the boxes sharing the most specific covering prefix of an IP are used as candidates
+                     when there are any (see iter_psboxes)
+    :param targetLocations: if != None, the locations of the IPs, used to limit their candidate boxes to the
+                     <nbNearest> geographically nearest ones (see iter_psboxes)
+    :param nbNearest: the maximum number of candidate boxes of a located IP
+    :return:         a dictionary whose values are the IPs and the keys are the corresponding closest boxes. If there
+                     is no entry for a given IP, no box has been found
+    """
+    results = {}
+    for result in iter_psboxes(IPs, verbose, recovery, refreshProbes, nbInFlight, cacheTTL, cacheFallback,
+                               samePrefixFirst, targetLocations, nbNearest):
+        if result is None:
+            return None
 
-    # waiting for ping-measurements to finish
-    if verbose:
-        print('Waiting for ping measurements to finish...\n')
-    status = cm.checkMeasurements(measurementIDs, True)
-    if status is None:
-        return None
+        IP, closestBox = result
+        results[IP] = closestBox
+        if callback is not None:
+            callback(IP, closestBox)
+    return results
 
-    while not status:
-        time.sleep(180)
-        status = cm.checkMeasurements(measurementIDs, True)
 
-        if status is None:
-            output.close()
+def psboxes_from_dump(filename, verbose, IPs=None):
+    """
+    Finds the closest box to the targets of the ping-results stored in the local dump <filename> instead of launching
+    measurements, and stores them in a file in the 'output' folder whose naming-scheme is
+    '<timestamp_of_creation_time>_psbox.txt' (with the label [DUMP], or [OK] if the closest box is located in the AS of
+    the target). The dump is read incrementally, so that only the best result per target is held in memory
+    :param filename:    the name of the dump (JSON array or NDJSON, possibly compressed with gzip or bzip2)
+    :param verbose:     if true, an error message gets displayed when an internal problem occurs; otherwise not
+    :param IPs:         if != None, only the results towards these IPs are analysed
+    :return:            a dictionary whose keys are target IPs and values are tuples in the form (<probeID>, <probeIP>,
+                        <probeAS>, <minRTT>); None if a problem occurred
+    """
+    targets = set(IPs) if IPs is not None else None
+    bestPerIP = {}
+    for line in dump.iterResults(filename, ('ping',), verbose):
+        if line is None:
             return None
+        IP = line.get('dst_addr')
+        if line.get('src_addr') == IP or (targets is not None and IP not in targets):
+            continue
 
-    if verbose:
-        print('Computing closest RIPE Atlas box...\n')
+        RTT = line.get('min')
+        if RTT is None or RTT == '*' or RTT < 0:  # target unreachable from this probe
+            continue
+        if IP not in bestPerIP or RTT < bestPerIP[IP][2]:
+            bestPerIP[IP] = (line['prb_id'], line['from'], RTT)  # probe's ID/IP/RTT
 
-    results = getSmallestPingProbe(IPsToMeasurementIDs, output)
+    catalogue = pc.loadProbeCatalogue(verbose)
+    if catalogue is None:
+        return None
 
-    output.close()
-    # os.remove('../logs/current_ping_measurementIDs.log')
-    # if os.path.exists('../logs/ID_To_AS.log'):
-    #     os.remove('../logs/ID_To_AS.log')
+    IPToASMap = IPToAS.mapIPtoAS(list(bestPerIP), '../lib/GeoIPASNum2.csv', verbose)
+    if IPToASMap is None:
+        return None
 
+    currentTime = datetime.datetime.fromtimestamp(time.time()).strftime('%Y-%m-%d-%H-%M-%S')
+    try:
+        output = open('../output/' + currentTime + '_psbox.txt', 'w')
+    except IOError:
+        if verbose:
+            print("error: Could not open/create file '../output/" + currentTime + "_psbox.txt'\n")
+        return None
+
+    results = {}
+    with output:
+        for IP in bestPerIP:
+            probeMinRTT = bestPerIP[IP]
+            probeToASMap[probeMinRTT[0]] = catalogue.getAS(probeMinRTT[0]) or 'NA'
+            additionalInfoAboutMeasurements[IP] = labelOfClosestBox('[DUMP]', IPToASMap.get(IP, 'NA_MAP'),
+                                                                    probeToASMap[probeMinRTT[0]])
+            results[IP] = writePSBox(IP, probeMinRTT, output)
     return results
 
 
@@ -388,14 +801,50 @@ if __name__ == '__main__':
                                                                                               "For more information about the "
                                                                                               "recovery-mode, please have a look "
                                                                                               "at the documentation in 'doc'")
+    parser.add_argument('-t', action="store", dest="cacheTTL", type=int, default=0,
+                        help="If > 0, closest boxes found less than this number of seconds ago are taken from the "
+                             "closest-box cache instead of being measured again (default: 0, cache disabled)")
+    parser.add_argument('-x', action="store", dest="cacheFallback", type=int, choices=[0, 1, 2], default=0,
+                        help="Cache entries that may be used for an IP: 0 for the same IP only, 1 to also use an IP of "
+                             "the same covering prefix and AS, 2 to also use any IP of the same AS")
+    parser.add_argument('-p', action="store", dest="samePrefix", type=int, choices=[0, 1], default=1,
+                        help="1 (default) if the boxes sharing the most specific covering prefix with an IP should be "
+                             "used as its candidate boxes when there are any, 0 to always use the boxes of its AS or "
+                             "of the neighbour ASes")
+    parser.add_argument('-g', action="store", dest="locations",
+                        help="File containing the locations of the IPs, one '<IP> <latitude> <longitude>' per line; the "
+                             "candidate boxes of a located IP are limited to the ones geographically nearest to it. The "
+                             "file has to be stored in the folder 'input'")
+    parser.add_argument('-m', action="store", dest="nbNearest", type=int, default=NB_NEAREST_DEFAULT,
+                        help="Maximum number of candidate boxes of an IP whose location is known (default: "
+                             + str(NB_NEAREST_DEFAULT) + ")")
+    parser.add_argument('-c', action="store", dest="inFlight", type=int, default=NB_IN_FLIGHT_DEFAULT,
+                        help="Maximum number of measurement-creation requests sent concurrently (default: "
+                             + str(NB_IN_FLIGHT_DEFAULT) + ")")
+    parser.add_argument('-u', action="store", dest="refresh", type=int, choices=[0, 1], default=0,
+                        help="1 if the list of connected RIPE Atlas boxes should be refreshed through the RIPE Atlas "
+                             "API in the background, 0 if only 'lib/probelist.txt' should be used")
+    parser.add_argument('-d', action="store", dest="dump", help="Local dump of ping-results (JSON array or one result "
+                                                                "per line, possibly compressed with gzip or bzip2) from "
+                                                                "which the closest boxes are computed instead of "
+                                                                "launching measurements")
+    parser.add_argument('-a', action="store", dest="resultCache", type=int, choices=[0, 1], default=1,
+                        help="1 (default) if the downloaded results should be kept in the local result cache "
+                             "'logs/results_cache' and read from it when available, 0 otherwise")
+    parser.add_argument('--http2', action="store", dest="http2", type=int, choices=[0, 1], default=0,
+                        help="1 if the requests to the RIPE Atlas API should be sent over HTTP/2 (requires the "
+                             "'httpx' package), 0 for HTTP/1.1 keep-alive connections (default)")
 
     arguments = vars(parser.parse_args())
 
-    if not arguments['targetIP'] and not arguments['filename']:
-        parser.error("You must either specify an IP or a filename of a file containing IPs!")
+    if not arguments['targetIP'] and not arguments['filename'] and not arguments['dump']:
+        parser.error("You must either specify an IP, a filename of a file containing IPs or a dump of ping-results!")
         exit(1)
 
     API_KEY = arguments['api-key']
+    rc.configureCache(enabled=arguments['resultCache'] == 1)
+    if ac.configureClient(http2=arguments['http2'] == 1) is None:
+        exit(1)
 
     # if an IP is specified, we always go for the IP
     if arguments['targetIP']:
@@ -404,6 +853,8 @@ if __name__ == '__main__':
             print('error: The indicated IPs must be in the format <X.X.X.X>!\n')
             exit(3)
         targetIPs = [targetIP]
+    elif not arguments['filename']:   # all the targets of the dump
+        targetIPs = None
     else:   # check file
         try:
             IPfile = open('../input/' + arguments['filename'], 'r')
@@ -423,14 +874,34 @@ if __name__ == '__main__':
                 targetIPs.append(l)
         IPfile.close()
 
+    targetLocations = None
+    if arguments['locations']:
+        targetLocations = loadTargetLocations('../input/' + arguments['locations'], True)
+        if targetLocations is None:
+            exit(2)
+
     # launch measurements and get psboxes
-    if arguments['recovery'] and arguments['recovery'] == 1:
+    if arguments['dump']:
+        psBoxMap = psboxes_from_dump(arguments['dump'], True, targetIPs)
+        if targetIPs is None and psBoxMap is not None:
+            targetIPs = sorted(psBoxMap)
+    elif arguments['recovery'] and arguments['recovery'] == 1:
         if not os.path.exists('../logs/current_ping_measurementIDs.log'):
             print("error: Could not launch recovery-mode!\n")
             exit(5)
-        psBoxMap = find_psboxes(targetIPs, True, True)
+        psBoxMap = find_psboxes(targetIPs, True, True, arguments['refresh'] == 1, arguments['inFlight'],
+                                cacheTTL=arguments['cacheTTL'], cacheFallback=arguments['cacheFallback'],
+                                samePrefixFirst=arguments['samePrefix'] == 1, targetLocations=targetLocations,
+                                nbNearest=max(1, arguments['nbNearest']))
     else:
-        psBoxMap = find_psboxes(targetIPs, True, False)
+        psBoxMap = find_psboxes(targetIPs, True, False, arguments['refresh'] == 1, arguments['inFlight'],
+                                cacheTTL=arguments['cacheTTL'], cacheFallback=arguments['cacheFallback'],
+                                samePrefixFirst=arguments['samePrefix'] == 1, targetLocations=targetLocations,
+                                nbNearest=max(1, arguments['nbNearest']))
+
+    for method, (count, mean, maximum) in sorted(ac.timingSummary().items()):
+        print('RIPE Atlas API: ' + str(count) + ' ' + method + ' requests, ' + '%.3f' % mean + 's on average, '
+              + '%.3f' % maximum + 's at most')
 
     if psBoxMap is not None and psBoxMap:
         for IP in targetIPs:
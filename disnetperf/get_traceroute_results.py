@@ -14,44 +14,273 @@ import sys
 sys.path.append('../')
 
 import argparse
+import csv
 import datetime
+import gzip
+import json
+import numbers
+import os
+import threading
 import time
+from array import array
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
+try:
+    import zstandard  # optional; only needed to compress the output with zstd
+except ImportError:
+    zstandard = None
 
 import disnetperf.AUX_IP_to_AS_map as parseIP
+import disnetperf.AUX_IP_to_PoP_map as parsePoP
+import disnetperf.AUX_alias_resolution as alias
+import disnetperf.AUX_atlas_client as ac
 import disnetperf.AUX_get_RouteViews_data as rv
-
-from ripe.atlas.cousteau import AtlasResultsRequest
+import disnetperf.AUX_result_cache as rc
+import disnetperf.AUX_result_dump as dump
 
 
 # global vars - begin
 
-# keys: (start, end) tuple where start is the beginning of a path and end the end of the path
-# values: the inferred AS-path (in form of a list) between start and end via RouteViews data;
-# empty list of no info available
-hiddenTraceroutePathParts = {}
-
-IPToPoPMapping = {}
+SEGMENT_CACHE_SIZE = 100000    # maximum number of AS-path segments inferred via RouteViews data kept in memory
+
+IPToPoPFilename = '../lib/ip_to_pop_mapping.txt'
+IPToPoPIndex = None     # the IP-to-PoP index (see loadIPToPoPMapping and getPoP); False if it could not be loaded
+PoPsOfIPs = {}          # keys: IPs already looked up; values: their PoP
+
+aliasFilename = None    # if != None, the alias lists used to group the interfaces by router (see loadAliasLists)
+aliasIndex = None       # the alias index (see loadAliasLists and getRouter); False if it could not be loaded
+routersOfIPs = {}       # keys: IPs already looked up; values: their router
+
+NB_WORKERS_DEFAULT = 8  # number of measurements whose results are downloaded concurrently
+
+# in follow-mode, this file stores for each measurement and probe the timestamp of the most recent result already saved
+HIGH_WATER_MARKS_FILENAME = '../logs/traceroute_results_state.txt'
+# in follow-mode, the results of a measurement are downloaded again from the oldest mark of its probes, and at least
+# FOLLOW_OVERLAP seconds before its newest mark (for the probes without a mark yet), but never from more than
+# FOLLOW_MAX_DELAY seconds before its newest mark: results uploaded later than that by a probe are missed
+FOLLOW_OVERLAP = 3600
+FOLLOW_MAX_DELAY = 86400
+
+DUMP_BATCH_SIZE = 1000  # number of results of a local dump that are mapped to ASes and saved at once
+
+# formats of the records in the output file
+FORMAT_TEXT = 'text'
+FORMAT_JSONL = 'jsonl'
+FORMAT_CSV = 'csv'
+FILE_EXTENSIONS = {FORMAT_TEXT: 'txt', FORMAT_JSONL: 'jsonl', FORMAT_CSV: 'csv'}
+COMPRESSION_EXTENSIONS = {None: '', 'gzip': '.gz', 'zstd': '.zst'}
+CSV_COLUMNS = ['probe_id', 'timestamp', 'nb_hops', 'hops', 'as_path', 'pop_path', 'ip_path']
+
+WRITE_BUFFER_SIZE = 1 << 20  # number of characters buffered before they are written to the output file
+
+# the IP-addresses of the traceroutes are stored once in <IPTable>; a measurement only keeps their indexes. The table is
+# emptied at the beginning of each run (see resetIPTable), so that it does not grow forever in follow-mode
+IPTable = []
+IPIndexes = {}          # keys: IPs; values: their index in <IPTable>
+IPTableLock = threading.Lock()
+NA_IP = -1              # index of an unknown IP-address ('NA_TR')
+NA_RTT = float('nan')   # unknown RTT
 # global vars - end
 
 
-class TracerouteMeasurement:
+def internIP(IP):
+    """
+    Returns the index of <IP> in the table <IPTable>, adding it if needed
+    """
+    index = IPIndexes.get(IP)
+    if index is None:
+        with IPTableLock:
+            index = IPIndexes.get(IP)
+            if index is None:
+                index = len(IPTable)
+                IPTable.append(IP)
+                IPIndexes[IP] = index
+    return index
+
+
+def resetIPTable():
+    """
+    Empties the table <IPTable>, as well as the PoPs and routers already looked up. The measurements parsed before
+    become unusable
+    """
+    with IPTableLock:
+        del IPTable[:]
+        IPIndexes.clear()
+    PoPsOfIPs.clear()
+    routersOfIPs.clear()
+
+
+class ASSegmentCache:
+    """
+    This class represents a cache of the AS-paths inferred via RouteViews data between the ASes surrounding the hidden
+    parts of traceroutes. A key is a tuple (<start>, <end>) and the value is the AS-path (in form of a list, including
+    <start> and <end>) between them; empty list if no info available. The least recently used segments are evicted
+    when the cache holds more than <maxEntries> segments
+    """
+    def __init__(self, maxEntries=SEGMENT_CACHE_SIZE):
+        """
+        Initializes the object's attributes
+        """
+        self.maxEntries = maxEntries
+        self.segments = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, start, end):
+        """
+        Returns the AS-path between <start> and <end>, looking it up in the RouteViews data if it is not cached.
+        The lookup is done while holding the lock (it is a search in the memory-mapped RouteViews index), so that a
+        segment is looked up only once however many workers ask for it, and the hit/miss counts are exact
+        """
+        key = (start, end)
+        with self.lock:
+            segment = self.segments.pop(key, None)
+            if segment is not None:
+                self.hits += 1
+                self.segments[key] = segment  # mark as most recently used
+                return segment
+
+            self.misses += 1
+            segment = rv.getASPath(start, end)
+            self.segments[key] = segment
+            while len(self.segments) > self.maxEntries:
+                self.segments.popitem(last=False)
+            return segment
+
+
+# the segments shared by all the measurements
+ASPathSegments = ASSegmentCache()
+
+
+def iterASPathGaps(ASPath):
+    """
+    Returns the hidden parts of the AS-path <ASPath> that can be completed, i.e. the runs of unknown AS-hops ('NA_TR'
+    or 'NA_MAP') surrounded by two different known ASes
+    :return:    a generator of tuples (<AS before the hidden part>, <AS after the hidden part>)
+    """
+    lastKnown = None
+    inGap = False
+    for AS in ASPath:
+        if AS == 'NA_TR' or AS == 'NA_MAP':
+            inGap = True
+            continue
+        if inGap and lastKnown is not None and lastKnown != AS:
+            yield lastKnown, AS
+        lastKnown = AS
+        inGap = False
+
+
+def fillASPathGaps(ASPath, getSegment):
+    """
+    Fills the hidden parts of the AS-path <ASPath> in a single pass and removes consecutive duplicates.
+    (Example: if <ASPath> = [A, NA_TR/NA_MAP, C]; the hidden part is replaced by the ASes traversed between A and C)
+    :param ASPath:      a list representing the AS-path to be completed
+    :param getSegment:  a function returning the AS-path (including its ends) between two ASes; empty list if unknown
+    :return:            the completed AS-path
+    """
+    finalASPath = []
+    lastCollapsed = False   # true if the last AS-hop read was a duplicate of the last AS-hop emitted
+    lastKnown = None
+    gap = []                # the unknown AS-hops read since <lastKnown>
+
+    def emit(AS):
+        if finalASPath and finalASPath[-1] == AS:
+            return True
+        finalASPath.append(AS)
+        return False
+
+    for AS in ASPath:
+        if AS == 'NA_TR' or AS == 'NA_MAP':
+            gap.append(AS)
+            continue
+
+        hiddenPart = []
+        if gap and lastKnown is not None and lastKnown != AS:
+            hiddenPart = getSegment(lastKnown, AS)
+
+        if len(hiddenPart) > 0:  # Did we find something useful? the segment replaces <lastKnown>, the gap and <AS>
+            if not lastCollapsed:
+                finalASPath.pop()
+            for hop in hiddenPart:
+                lastCollapsed = emit(hop)
+        else:
+            for hop in gap:
+                emit(hop)
+            lastCollapsed = emit(AS)
+        lastKnown = AS
+        gap = []
+
+    for hop in gap:
+        emit(hop)
+    return finalASPath
+
+
+def completeASPaths(ASPaths):
     """
-    This class represents a traceroute-measurement
+    Completes many AS-paths at once (see TracerouteMeasurement.completeASPath). Each distinct hidden part is looked up
+    only once, however many paths it appears in
+    :param ASPaths: a list of AS-paths (each one in form of a list)
+    :return:        the list of the completed AS-paths, in the same order
     """
+    segments = {}
+    for ASPath in ASPaths:
+        for gap in iterASPathGaps(ASPath):
+            if gap not in segments:
+                segments[gap] = ASPathSegments.get(gap[0], gap[1])
+
+    return [fillASPathGaps(ASPath, lambda start, end: segments[(start, end)]) for ASPath in ASPaths]
+
+
+class TracerouteMeasurement(object):
+    """
+    This class represents a traceroute-measurement. To keep millions of measurements in memory, the hops are stored in
+    packed arrays: the IPs as indexes in the table <IPTable> (NA_IP if unknown) and the RTTs as floats (NA_RTT if
+    unknown). The hops whose RTT is an integer are listed apart, so that the RTTs are written as they were received
+    """
+    __slots__ = ('probeID', 'nbHops', 'timestamp', 'sourceIP', 'hopIPs', 'hopRTTs', 'intRTTHops')
+
     def __init__(self):
         """
         Initializes the object's attributes
         """
         self.probeID = ''   # the source-probe's ID
         self.nbHops = -1    # the number of IP-hops performed until the destination was reached
+        self.timestamp = -1 # the UNIX-timestamp corresponding to the time at which the measurement was launched
 
-        # list of tuples where each tuple has the form (<IP>, <INFO>)
-        # if the IP-address is known, <IP> = given address; 'NA_TR' otherwise
-        # <INFO> = 'init' if the tuple describes the source-IP address; the RTT if the analysed IP corresponds to the
-        # one of a hop; the empty-string if RTT is unknown for a hop-IP
-        self.IPInfos = []
+        self.sourceIP = NA_IP           # index of the source-IP address in <IPTable>
+        self.hopIPs = array('i')        # indexes of the hop-IP addresses in <IPTable>; NA_IP if the address is unknown
+        self.hopRTTs = array('d')       # RTTs of the hops; NA_RTT if unknown
+        self.intRTTHops = None          # tuple of the positions of the hops whose RTT is an integer; None if there are none
 
-        self.timestamp = -1 # the UNIX-timestamp corresponding to the time at which the measurement was launched
+    @property
+    def IPInfos(self):
+        """
+        The list of tuples (<IP>, <INFO>) describing the source and the hops
+        if the IP-address is known, <IP> = given address; 'NA_TR' otherwise
+        <INFO> = 'init' if the tuple describes the source-IP address; the RTT if the analysed IP corresponds to the
+        one of a hop; the empty-string if RTT is unknown for a hop-IP
+        """
+        IPInfos = []
+        if self.sourceIP != NA_IP:
+            IPInfos.append((IPTable[self.sourceIP], 'init'))
+        for position, (IPIndex, RTT) in enumerate(zip(self.hopIPs, self.hopRTTs)):
+            if RTT != RTT:  # NaN != NaN
+                RTT = ''
+            elif self.intRTTHops and position in self.intRTTHops:
+                RTT = int(RTT)
+            IPInfos.append((IPTable[IPIndex] if IPIndex != NA_IP else 'NA_TR', RTT))
+        return IPInfos
+
+    def addresses(self):
+        """
+        Returns the set of the known IP-addresses (source and hops) of this measurement
+        """
+        indexes = set(self.hopIPs)
+        indexes.add(self.sourceIP)
+        indexes.discard(NA_IP)
+        return set(IPTable[index] for index in indexes)
 
     def addProbeID(self, probe):
         """
@@ -75,7 +304,13 @@ class TracerouteMeasurement:
         """
         Adds the tuple (<IP>, <info>) to the IPinfos-attribute
         """
-        self.IPInfos.append((IP, info))
+        if info == 'init':
+            self.sourceIP = internIP(IP)
+            return
+        if isinstance(info, numbers.Integral) and not isinstance(info, bool):
+            self.intRTTHops = (self.intRTTHops or ()) + (len(self.hopRTTs),)
+        self.hopIPs.append(internIP(IP) if IP != 'NA_TR' else NA_IP)
+        self.hopRTTs.append(float(info) if info != '' else NA_RTT)
 
     def completeASPath(self, ASPathArg):
         """
@@ -86,133 +321,421 @@ class TracerouteMeasurement:
         :param ASPathArg:   a list representing the ASPath to be analysed
         :return:            the processed ASPath
         """
-        idx = 0
-        ASPath = list(ASPathArg)
-
-        beginHiddenPathIdx = -1
-        beginHiddenPathAS = ''
-        endHiddenPathIdx = -1
-        endHiddenPathAS = ''
-
-        while idx < len(ASPath):
-            if ASPath[idx] != 'NA_TR' and ASPath[idx] != 'NA_MAP':  # Is this AS-hop unknown?
-                if beginHiddenPathAS != '':
-                    endHiddenPathAS = ASPath[idx]
-                    endHiddenPathIdx = idx
-                    hiddenPart = []
-
-                    # the start-AS and the end-AS of this part with missing info are different. We try to complete it
-                    if beginHiddenPathAS != endHiddenPathAS:
-                        if (beginHiddenPathAS, endHiddenPathAS) not in hiddenTraceroutePathParts:
-                            hiddenPart = rv.getASPath(beginHiddenPathAS, endHiddenPathAS)
-                            hiddenTraceroutePathParts[(beginHiddenPathAS, endHiddenPathAS)] = hiddenPart
-                        else:
-                            hiddenPart = hiddenTraceroutePathParts[(beginHiddenPathAS, endHiddenPathAS)]
-                    beginHiddenPathAS = ''
-                    endHiddenPathAS = ''
-                    if len(hiddenPart) > 0:  # Did we find something useful?
-                        ASPath = ASPath[:beginHiddenPathIdx] + hiddenPart + ASPath[endHiddenPathIdx + 1:]
-                        idx = beginHiddenPathIdx
-                    else:
-                        idx += 1
-                else:
-                    idx += 1
+        return fillASPathGaps(ASPathArg, ASPathSegments.get)
+
+    def ASHops(self, ASMapping):
+        """
+        Returns the AS-path of this measurement before completion, i.e. the ASes of its IPs ('NA_TR' if the IP is
+        unknown, 'NA_MAP' if it could not be mapped), consecutive duplicates removed
+        :param ASMapping:   a dictionary. A key is an IP and the corresponding value is the AS which it is located in
+        """
+        ASes = []
+        for ip in self.IPInfos:
+            if ip[0] == 'NA_TR':
+                res = 'NA_TR'
             else:
-                if idx - 1 >= 0 and ASPath[idx - 1] != 'NA_TR' and ASPath[idx - 1] != 'NA_MAP':
-                    beginHiddenPathAS = ASPath[idx - 1]
-                    beginHiddenPathIdx = idx - 1
-                    idx += 1
-                else:
-                    idx += 1
+                res = ASMapping[ip[0]]
+            if len(ASes) == 0 or res != ASes[-1]:
+                ASes.append(res)
+        return ASes
 
-        finalASPath = []
-        for path in ASPath:
-            length = len(finalASPath)
-            if length == 0 or finalASPath[length - 1] != path:
-                finalASPath.append(path)
-        return finalASPath
+    def toRecord(self, ASMapping, ASPath=None):
+        """
+        Returns the information about this measurement that gets saved to the output-file
+        :param ASMapping:   a dictionary. A key is an IP and the corresponding value is the AS which it is located in.
+                            The IP-to-AS mapping is done through a database provided by MaxMind
+        :param ASPath:      the completed AS-path of this measurement, if already known (see completeASPaths)
+        :return:            a dictionary with the keys 'probe_id', 'timestamp', 'nb_hops', 'hops' (a list of tuples
+                            (<IP>, <RTT>) where <RTT> is '' if unknown), 'as_path', 'pop_path', 'ip_path' and, if
+                            alias lists are used, 'router_path' (consecutive interfaces of the same router collapsed)
+        """
+        PoPs = []
+        IPs = []
+        hops = []
+        routers = []
+
+        for ip in self.IPInfos:
+            IPs.append(ip[0])
+            if ip[1] != 'init':
+                hops.append((ip[0], ip[1]))
+
+            if ip[0] != 'NA_TR':
+                router = getRouter(ip[0])
+                pop = getPoP(router)
+                if pop == 'NA' and router != ip[0]:  # the PoP of the interface itself may be known
+                    pop = getPoP(ip[0])
+            else:
+                router = 'NA_TR'
+                pop = 'NA'
+            if len(PoPs) == 0 or pop != PoPs[-1]:
+                PoPs.append(pop)
+            if len(routers) == 0 or router != routers[-1]:
+                routers.append(router)
+
+        if ASPath is None:
+            ASPath = self.completeASPath(self.ASHops(ASMapping))
+        record = {'probe_id': self.probeID, 'timestamp': self.timestamp, 'nb_hops': self.nbHops, 'hops': hops,
+                  'as_path': ASPath, 'pop_path': PoPs, 'ip_path': IPs}
+        if aliasFilename is not None:
+            record['router_path'] = routers
+        return record
 
     def saveToFile(self, ASMapping, currentTime):
         """
         Writes the information about this measurement to the file '<timestamp>_scheduled_traceroutes.txt'
         in the output folder. For the exact format of the output-file, please check the documentation.
+        (To save many measurements, use a single TracerouteWriter instead.)
         :param ASMapping:   a dictionary. A key is an IP and the corresponding value is the AS which it is located in.
                             The IP-to-AS mapping is done through a database provided by MaxMind
         :param currentTime: the timestamp to use in the name of the output file
         """
-        try:
-            pointerToFile = open('../output/' + currentTime + '_scheduled_traceroutes.txt', 'a')
-        except IOError:
-            print("error: Could not open/create file '../output/" + currentTime + "'_scheduled_traceroutes.txt'\n")
+        writer = TracerouteWriter(currentTime)
+        if writer.open() is None:
             return None
+        writer.add(self, ASMapping)
+        writer.close()
 
-        pointerToFile.write("PROBEID:\t" + str(self.probeID) + '\n')
-        pointerToFile.write("TIMESTAMP:\t" + str(self.timestamp) + '\n')
-        pointerToFile.write("NBHOPS:\t" + str(self.nbHops) + '\n')
-
-        ASes = []
-        PoPs = []
-        IPs = []
 
-        for ip in self.IPInfos:
-            IPs.append(ip[0])
-            if ip[1] != '' and ip[1] != 'init':
-                pointerToFile.write("HOP:" + '\t' + str(ip[0]) + '\t' + str(ip[1]) + '\n')
-            elif ip[1] != 'init':
-                pointerToFile.write("HOP:" + '\t' + str(ip[0]) + '\n')
+class TracerouteWriter:
+    """
+    This class writes traceroute-measurements to the file '<prefix>_scheduled_traceroutes.<format>[.gz|.zst]' in the
+    output folder. The file is opened once and the records are written in large blocks; the file can be compressed and
+    the records written as text (see the documentation), JSON lines or CSV
+    """
+    def __init__(self, prefix, recordFormat=FORMAT_TEXT, compression=None, bufferSize=WRITE_BUFFER_SIZE):
+        """
+        Initializes the object's attributes
+        :param prefix:          the prefix of the name of the output file (usually a timestamp)
+        :param recordFormat:    FORMAT_TEXT, FORMAT_JSONL or FORMAT_CSV
+        :param compression:     None, 'gzip' or 'zstd' ('zstd' requires the 'zstandard' package)
+        :param bufferSize:      the number of characters buffered before they are written to the file
+        """
+        self.filename = '../output/' + prefix + '_scheduled_traceroutes.' + FILE_EXTENSIONS[recordFormat] \
+                        + COMPRESSION_EXTENSIONS[compression]
+        self.recordFormat = recordFormat
+        self.compression = compression
+        self.bufferSize = bufferSize
+        self.buffer = []
+        self.bufferedSize = 0
+        self.outputFile = None
+        self.csvWriter = csv.writer(self, lineterminator='\n')  # the CSV rows are written into <buffer>
+
+    def open(self):
+        """
+        Opens the output file; the records are appended if it already exists
+        :return:    True if the file has been opened; None otherwise
+        """
+        if self.compression == 'zstd' and zstandard is None:
+            print("error: The 'zstandard' package is required to compress the output with zstd!\n")
+            return None
 
-            if ip[0] == 'NA_TR':
-                res = 'NA_TR'
+        isNew = not os.path.exists(self.filename) or os.path.getsize(self.filename) == 0
+        try:
+            if self.compression == 'gzip':
+                self.outputFile = gzip.open(self.filename, 'ab')
+            elif self.compression == 'zstd':
+                self.outputFile = zstandard.ZstdCompressor().stream_writer(open(self.filename, 'ab'))
             else:
-                res = ASMapping[ip[0]]
-            if len(ASes) == 0 or res != ASes[-1]:
-                ASes.append(res)
+                self.outputFile = open(self.filename, 'ab')
+        except IOError:
+            print("error: Could not open/create file '" + self.filename + "'\n")
+            return None
 
-            if ip[0] in IPToPoPMapping:
-                pop = IPToPoPMapping[ip[0]]
-            else:
-                pop = 'NA'
-            if len(PoPs) == 0 or pop != PoPs[-1]:
-                PoPs.append(pop)
+        if isNew and self.recordFormat == FORMAT_CSV:
+            self.csvWriter.writerow(CSV_COLUMNS + (['router_path'] if aliasFilename is not None else []))
+        return True
 
-        pointerToFile.write("ASPATH:\t" + '\t'.join(self.completeASPath(ASes)) + '\n')
-        pointerToFile.write("POPPATH:\t" + '\t'.join(PoPs) + '\n')
-        pointerToFile.write("IPPATH:\t" + '\t'.join(IPs) + '\n')
+    def add(self, measurement, ASMapping, ASPath=None):
+        """
+        Adds the measurement <measurement> to the output file
+        :param measurement: a TracerouteMeasurement object
+        :param ASMapping:   a dictionary. A key is an IP and the corresponding value is the AS which it is located in
+        :param ASPath:      the completed AS-path of the measurement, if already known
+        """
+        record = measurement.toRecord(ASMapping, ASPath)
+
+        if self.recordFormat == FORMAT_JSONL:
+            record['hops'] = [[IP, RTT if RTT != '' else None] for IP, RTT in record['hops']]
+            self.write(json.dumps(record, separators=(',', ':')) + '\n')
+        elif self.recordFormat == FORMAT_CSV:
+            row = [record['probe_id'], record['timestamp'], record['nb_hops'],
+                   ' '.join(str(IP) + '|' + str(RTT) for IP, RTT in record['hops']),
+                   ' '.join(record['as_path']), ' '.join(record['pop_path']), ' '.join(record['ip_path'])]
+            if 'router_path' in record:
+                row.append(' '.join(record['router_path']))
+            self.csvWriter.writerow(row)
+        else:
+            lines = ["PROBEID:\t" + str(record['probe_id']) + '\n',
+                     "TIMESTAMP:\t" + str(record['timestamp']) + '\n',
+                     "NBHOPS:\t" + str(record['nb_hops']) + '\n']
+            for IP, RTT in record['hops']:
+                if RTT != '':
+                    lines.append("HOP:" + '\t' + str(IP) + '\t' + str(RTT) + '\n')
+                else:
+                    lines.append("HOP:" + '\t' + str(IP) + '\n')
+            lines.append("ASPATH:\t" + '\t'.join(record['as_path']) + '\n')
+            lines.append("POPPATH:\t" + '\t'.join(record['pop_path']) + '\n')
+            lines.append("IPPATH:\t" + '\t'.join(record['ip_path']) + '\n')
+            if 'router_path' in record:
+                lines.append("ROUTERPATH:\t" + '\t'.join(record['router_path']) + '\n')
+            self.write(''.join(lines))
+
+    def write(self, data):
+        """
+        Buffers the string <data> and writes the buffer to the output file once it holds <bufferSize> characters
+        """
+        self.buffer.append(data)
+        self.bufferedSize += len(data)
+        if self.bufferedSize >= self.bufferSize:
+            self.outputFile.write(''.join(self.buffer).encode('utf-8'))
+            self.buffer = []
+            self.bufferedSize = 0
+
+    def flush(self):
+        """
+        Writes the buffered records to the output file
+        """
+        if self.buffer:
+            self.outputFile.write(''.join(self.buffer).encode('utf-8'))
+            self.buffer = []
+            self.bufferedSize = 0
+        self.outputFile.flush()
 
-        pointerToFile.close()
+    def close(self):
+        """
+        Writes the buffered records and closes the output file
+        """
+        if self.outputFile is not None:
+            self.flush()
+            self.outputFile.close()
+            self.outputFile = None
 
 
 def loadIPToPoPMapping(filename):
     """
-    Fills the dictionary <IPToPoPMapping>. A key corresponds to an IP and the value to the PoP in which it is located.
-    The IP-to-PoP mapping is performed through a database provided by the iPlane project
+    Selects the file used for the IP-to-PoP mapping. The IP-to-PoP mapping is performed through a database provided
+    by the iPlane project; the file is compiled into an index, which is loaded here so that a file that cannot be
+    compiled is reported before any traceroute is analysed. If this function is not called, the index of the default
+    file is loaded at the first PoP lookup
     :param filename:    name of the file containing the mappings
     :return:            None if a problem occurred; True otherwise
     """
-    try:
-        PoPFile = open(filename, 'r')
-    except IOError:
+    global IPToPoPFilename, IPToPoPIndex
+    if not os.path.isfile(filename):
         print("error: Could not open file '" + filename + "'!\n")
         return None
 
-    for line in PoPFile:
-        l = line.rstrip('\r\n')
-        if l:
-            pair = l.split()
-            IPToPoPMapping[pair[0]] = pair[1]
-    PoPFile.close()
+    index = parsePoP.loadIPtoPoPIndex(filename, True)
+    if index is None:
+        return None
+
+    IPToPoPFilename = filename
+    IPToPoPIndex = index
+    PoPsOfIPs.clear()
     return True
 
 
-def retrieve_traceroute_results(filename, verbose):
+def getPoP(IP):
     """
-    Downloads and parses traceroute-results for the measurement-IDs indicated in file '../logs/<filename>' and write
-    results to file '../output/<timestamp>_scheduled_traceroutes.log'
-    The input-file has to be located in the input-folder.
-    For the exact format to be followed by the input-file, please have a look at the documentation
-    The download of user-defined-measurement-results is done via the Atlas-toolbox
+    Returns the PoP in which <IP> is located, or the PoP of the longest prefix covering <IP> if <IP> itself is not
+    mapped
+    :return:    the PoP-ID or 'NA' if unknown
+    """
+    global IPToPoPIndex
+    PoP = PoPsOfIPs.get(IP)
+    if PoP is not None:
+        return PoP
+
+    if IPToPoPIndex is None:
+        IPToPoPIndex = parsePoP.loadIPtoPoPIndex(IPToPoPFilename, True) or False
+    PoP = IPToPoPIndex.lookup(IP) if IPToPoPIndex else 'NA'
+    PoPsOfIPs[IP] = PoP
+    return PoP
+
+
+def loadAliasLists(filename):
+    """
+    Enables alias resolution: the interfaces listed in the same alias set of <filename> are considered as a single
+    router, whose AS and PoP are looked up once, and a router-level path is added to the output. The alias lists are
+    compiled into an index, which is loaded here so that alias lists that cannot be compiled are reported before any
+    traceroute is analysed
+    :param filename:    name of the file containing the alias lists (one set of interface addresses per line)
+    :return:            None if a problem occurred; True otherwise
+    """
+    global aliasFilename, aliasIndex
+    if not os.path.isfile(filename):
+        print("error: Could not open file '" + filename + "'!\n")
+        return None
+
+    index = alias.loadAliasIndex(filename, True)
+    if index is None:
+        return None
+
+    aliasFilename = filename
+    aliasIndex = index
+    routersOfIPs.clear()
+    return True
+
+
+def getRouter(IP):
+    """
+    Returns the router the interface <IP> belongs to
+    :return:    the smallest interface address of the router; <IP> itself if alias resolution is disabled or <IP> is
+                not listed in the alias lists
+    """
+    global aliasIndex
+    if aliasFilename is None:
+        return IP
+
+    router = routersOfIPs.get(IP)
+    if router is not None:
+        return router
+
+    if aliasIndex is None:
+        aliasIndex = alias.loadAliasIndex(aliasFilename, True) or False
+    router = aliasIndex.router(IP) if aliasIndex else IP
+    routersOfIPs[IP] = router
+    return router
+
+
+def parseTracerouteResult(result):
+    """
+    Builds the TracerouteMeasurement object corresponding to a traceroute-result returned by the RIPE Atlas API
+    :param result:  a dictionary describing the result of a single traceroute
+    :return:        the TracerouteMeasurement object; None if <result> is empty or malformed
+    """
+    if not result:
+        return None
+
+    currentMeasurement = TracerouteMeasurement()
+    try:
+        currentMeasurement.addProbeID(result["prb_id"])
+        currentMeasurement.addNbHops(len(result["result"]))
+        currentMeasurement.addTimestamp(result["timestamp"])
+        currentMeasurement.addIPInfo(result["src_addr"], 'init')
+
+        for hop in result["result"]:
+            hop = hop['result']
+
+            # If the first probe is invalid, consider all of them are invalid (if the destination is
+            # unreachable, no reason it suddenly becomes reachable again in such a small amount of time).
+            if 'x' in hop[0]:
+                currentMeasurement.addIPInfo('NA_TR', '')
+                continue
+
+            # Take the minimum RTT values for each probe (some packets of a hop may be lost or erroneous).
+            rtts = [r['rtt'] for r in hop if 'rtt' in r]
+            if not rtts:
+                currentMeasurement.addIPInfo('NA_TR', '')
+                continue
+
+            currentMeasurement.addIPInfo(hop[0]['from'], min(rtts))
+    except (KeyError, IndexError, TypeError, ValueError):
+        return None
+    return currentMeasurement
+
+
+def fetchTracerouteResults(job):
+    """
+    Downloads the results of a traceroute-measurement. Failed requests are retried by the request scheduler
+    :param job: a tuple (<udm>, <start>) where <udm> is the ID of the measurement and <start> is None or the UNIX
+                timestamp of the oldest result to download
+    :return:    a tuple (<udm>, <list of results>) where <list of results> is None if the download failed
+    """
+    udm, start = job
+    is_success, resultInfo = rc.getResults(udm, start=start)
+    if not is_success or not isinstance(resultInfo, list):
+        return udm, None
+    return udm, resultInfo
+
+
+def iterTracerouteResults(udms, nbWorkers=NB_WORKERS_DEFAULT, highWaterMarks=None):
+    """
+    Downloads the results of the measurements <udms> concurrently
+    :param udms:            a list of measurement IDs
+    :param nbWorkers:       the maximum number of downloads in progress at the same time
+    :param highWaterMarks:  if != None, the marks of the results already saved (see loadHighWaterMarks); only the
+                            results obtained after the oldest mark of the probes of a measurement, or FOLLOW_OVERLAP
+                            seconds before its newest mark if earlier (but at most FOLLOW_MAX_DELAY seconds before it),
+                            are downloaded
+    :return:                a generator of tuples (<udm>, <list of results>), in the order in which the downloads
+                            finish; <list of results> is None if the download failed
+    """
+    if not udms:
+        return
+
+    jobs = []
+    for udm in udms:
+        if highWaterMarks is not None and highWaterMarks.get(udm):
+            marks = highWaterMarks[udm].values()
+            start = min(min(marks), max(marks) - FOLLOW_OVERLAP)
+            jobs.append((udm, max(start, max(marks) - FOLLOW_MAX_DELAY) + 1))
+        else:
+            jobs.append((udm, None))
+
+    pool = ThreadPool(max(1, min(nbWorkers, len(jobs))))
+    try:
+        for udm, resultInfo in pool.imap_unordered(fetchTracerouteResults, jobs):
+            yield udm, resultInfo
+    finally:
+        pool.terminate()
+
+
+def loadHighWaterMarks(filename=HIGH_WATER_MARKS_FILENAME):
+    """
+    Reads the timestamps of the most recent results already saved in follow-mode, per measurement and probe. A missing
+    file means that no result has been saved yet
+    :param filename:    the file the timestamps are stored in (format: <UDM> <probe ID> <timestamp>; lines in the
+                        format <UDM> <timestamp>, written by previous versions, hold a mark for all the probes)
+    :return:            a dictionary with measurement IDs as keys and, as values, dictionaries with probe IDs (None
+                        for all the probes without their own mark) as keys and UNIX timestamps as values; None if the
+                        file could not be read
+    """
+    highWaterMarks = {}
+    if not os.path.exists(filename):
+        return highWaterMarks
+
+    try:
+        with open(filename, 'r') as stateFile:
+            for line in stateFile:
+                data = line.rstrip('\r\n').split('\t')
+                if len(data) == 3:
+                    highWaterMarks.setdefault(data[0], {})[int(data[1])] = int(data[2])
+                elif len(data) == 2:
+                    highWaterMarks.setdefault(data[0], {})[None] = int(data[1])
+    except (IOError, ValueError):
+        print("error: Could not read file '" + filename + "'!\n")
+        return None
+    return highWaterMarks
+
+
+def saveHighWaterMarks(highWaterMarks, filename=HIGH_WATER_MARKS_FILENAME):
+    """
+    Writes the timestamps of the most recent results already saved in follow-mode (see loadHighWaterMarks)
+    :return:    True if the file has been written; None otherwise
+    """
+    tmpFilename = filename + '.tmp'
+    try:
+        with open(tmpFilename, 'w') as stateFile:
+            for udm in sorted(highWaterMarks):
+                for probeID, mark in sorted(highWaterMarks[udm].items(), key=lambda item: (item[0] is not None, item[0])):
+                    if probeID is None:
+                        stateFile.write(udm + '\t' + str(mark) + '\n')
+                    else:
+                        stateFile.write(udm + '\t' + str(probeID) + '\t' + str(mark) + '\n')
+        os.rename(tmpFilename, filename)
+    except (IOError, OSError):
+        print("error: Could not write file '" + filename + "'!\n")
+        return None
+    return True
+
+
+def loadMeasurementIDs(filename):
+    """
+    Reads the measurement IDs listed in file <filename>. Each line has the format <UDM_ID_1>...<UDM_ID_X> <targetIP>
     :param filename:    the name of the file containing measurement-IDs
-    :param verbose:     if true, the progress will be written to the standard-output
+    :return:            the list of measurement IDs (without duplicates, in the order of the file); None if the file
+                        could not be read
     """
     try:
         udmFile = open(filename, 'r')
@@ -220,64 +743,195 @@ def retrieve_traceroute_results(filename, verbose):
         print("error: Could not open '" + filename + "'!\n")
         return None
 
-    measurementsToAnalyse = []
-    IPsToAnalyse = set()
-
+    udms = []
+    seen = set()
     for udmLine in udmFile:
         data = udmLine.rstrip('\r\n').split('\t')
-        udms = data[:-1]
-        dstIP = data[-1]
+        for udm in data[:-1]:
+            if udm and udm not in seen:
+                seen.add(udm)
+                udms.append(udm)
+    udmFile.close()
+    return udms
+
 
-        for udm in udms:
-            is_success, resultInfo = AtlasResultsRequest(msm_id=udm).create()
-            if not is_success:
-                print("Can't get udm results...\n")
-                break
+def saveTracerouteResults(results, writer, verbose, probeMarks=None):
+    """
+    Parses the traceroute-results <results>, maps their IPs to ASes and adds them to the output file of <writer>
+    :param results:     an iterable of dictionaries, each one describing the result of a single traceroute
+    :param writer:      the TracerouteWriter object the measurements are written with
+    :param verbose:     if true, the progress will be written to the standard-output
+    :param probeMarks:  if != None, a dictionary with probe IDs as keys (None for all the other probes) and UNIX
+                        timestamps as values: only the results obtained after the timestamp of their probe are saved
+    :return:            the list of the saved TracerouteMeasurement objects; None if a problem occurred. The number of
+                        malformed results that are skipped is displayed
+    """
+    measurementsToAnalyse = []
+    IPsToAnalyse = set()
+    nbMalformed = 0
+    for result in results:
+        currentMeasurement = parseTracerouteResult(result)
+        if currentMeasurement is None:
+            nbMalformed += 1
+            continue
+        if probeMarks and currentMeasurement.timestamp <= probeMarks.get(currentMeasurement.probeID,
+                                                                         probeMarks.get(None, -1)):
+            continue    # already saved by a previous call
 
-            for result in resultInfo:
-                if not result:
-                    continue
+        if verbose:
+            print('Analysing traceroute from ' + result["src_addr"] + ' to ' + result["dst_addr"] + '...\n')
 
-                if verbose:
-                    print('Analysing traceroute from ' + result["src_addr"] + ' to ' + result["dst_addr"] + '...\n')
+        measurementsToAnalyse.append(currentMeasurement)
+        IPsToAnalyse.update(currentMeasurement.addresses())
 
-                currentMeasurement = TracerouteMeasurement()
-                currentMeasurement.addProbeID(result["prb_id"])
-                currentMeasurement.addNbHops(len(result["result"]))
-                currentMeasurement.addTimestamp(result["timestamp"])
+    if nbMalformed:
+        print("warning: " + str(nbMalformed) + " malformed traceroute-result(s) skipped\n")
 
-                IPsToAnalyse.add(result["src_addr"])
-                currentMeasurement.addIPInfo(result["src_addr"], 'init')
+    # We will do the IP-to-AS mapping and store the results to a file.
+    if aliasFilename is not None:   # the interfaces of a router are mapped once, through the router's address
+        routers = dict((IP, getRouter(IP)) for IP in IPsToAnalyse)
+        routerToASMapping = parseIP.mapIPtoAS(set(routers.values()), '../lib/GeoIPASNum2.csv', verbose)
+        if routerToASMapping is None:
+            return None
+        IPToASMapping = dict((IP, routerToASMapping[routers[IP]]) for IP in routers)
+
+        # the interfaces whose router could not be mapped are mapped through their own address
+        unmappedIPs = [IP for IP in routers if IPToASMapping[IP] == 'NA_MAP' and routers[IP] != IP]
+        if unmappedIPs:
+            ownMapping = parseIP.mapIPtoAS(unmappedIPs, '../lib/GeoIPASNum2.csv', verbose)
+            if ownMapping is None:
+                return None
+            IPToASMapping.update(ownMapping)
+    else:
+        IPToASMapping = parseIP.mapIPtoAS(IPsToAnalyse, '../lib/GeoIPASNum2.csv', verbose)
+        if IPToASMapping is None:
+            return None
 
-                for hop in result["result"]:
-                    hop = hop['result']
+    ASPaths = completeASPaths([measurement.ASHops(IPToASMapping) for measurement in measurementsToAnalyse])
+    for measurement, ASPath in zip(measurementsToAnalyse, ASPaths):
+        writer.add(measurement, IPToASMapping, ASPath)
+    return measurementsToAnalyse
 
-                    # If the first probe is invalid, consider all of them are invalid (if the destination is
-                    # unreachable, no reason it suddenly becomes reachable again in such a small amount of time).
-                    if 'x' in hop[0]:
-                        currentMeasurement.addIPInfo('NA_TR', '')
-                        continue
 
-                    # Take the minimum RTT values for each probe.
-                    rtt = min(r['rtt'] for r in hop)
+def retrieve_traceroute_results(filename, verbose, nbWorkers=NB_WORKERS_DEFAULT, follow=False,
+                                recordFormat=FORMAT_TEXT, compression=None):
+    """
+    Downloads and parses traceroute-results for the measurement-IDs indicated in file '../logs/<filename>' and write
+    results to file '../output/<timestamp>_scheduled_traceroutes.log'
+    The input-file has to be located in the input-folder.
+    For the exact format to be followed by the input-file, please have a look at the documentation
+    The results of the different measurements are downloaded concurrently, and the results of a measurement are
+    analysed and saved as soon as they are downloaded
+    In follow-mode, only the results obtained since the previous call are downloaded, and they are appended to the file
+    '../output/<name of the input-file>_scheduled_traceroutes.txt'
+    :param filename:    the name of the file containing measurement-IDs
+    :param verbose:     if true, the progress will be written to the standard-output
+    :param nbWorkers:   the maximum number of downloads in progress at the same time
+    :param follow:      if true, follow-mode is enabled
+    :param recordFormat: the format of the records in the output file (see TracerouteWriter)
+    :param compression: None, 'gzip' or 'zstd'
+    :return:            the list of the measurement IDs whose results could not be downloaded; None if a problem
+                        occurred
+    """
+    udms = loadMeasurementIDs(filename)
+    if udms is None:
+        return None
+    resetIPTable()
 
-                    currentMeasurement.addIPInfo(hop[0]['from'], rtt)
-                    IPsToAnalyse.add(hop[0]['from'])
+    # we load the IP-to-AS mapping once, so that the results of each measurement can be mapped as soon as they arrive
+    if parseIP.loadIPtoASIndex('../lib/GeoIPASNum2.csv', verbose) is None:
+        return None
 
-                measurementsToAnalyse.append(currentMeasurement)
+    highWaterMarks = None
+    if follow:
+        highWaterMarks = loadHighWaterMarks()
+        if highWaterMarks is None:
+            return None
+        currentTime = os.path.splitext(os.path.basename(filename))[0]
+    else:
+        currentTime = datetime.datetime.fromtimestamp(time.time()).strftime('%Y-%m-%d-%H-%M-%S')
+    failedUDMs = []
 
-    # We will do the IP-to-AS mapping and store the results to a file.
-    IPToASMapping = parseIP.mapIPtoAS(IPsToAnalyse, '../lib/GeoIPASNum2.csv', verbose)
-    if IPToASMapping is None:
+    writer = TracerouteWriter(currentTime, recordFormat, compression)
+    if writer.open() is None:
         return None
 
-    if verbose:
-        print('Saving results to file...\n')
+    try:
+        for udm, resultInfo in iterTracerouteResults(udms, nbWorkers, highWaterMarks):
+            if resultInfo is None:
+                print("error: Could not get the results of measurement " + str(udm) + "\n")
+                failedUDMs.append(udm)
+                continue
+
+            if verbose:
+                print('Saving results of measurement ' + str(udm) + ' to file...\n')
+
+            probeMarks = highWaterMarks.get(udm) if highWaterMarks is not None else None
+            measurementsToAnalyse = saveTracerouteResults(resultInfo, writer, verbose, probeMarks)
+            if measurementsToAnalyse is None:
+                return None
+
+            # the marks are only moved once the results are written, so that an interrupted call does not lose any
+            # result. A mark per probe keeps the results that a probe uploads late from being skipped
+            if highWaterMarks is not None and measurementsToAnalyse:
+                writer.flush()
+                probeMarks = highWaterMarks.setdefault(udm, {})
+                for m in measurementsToAnalyse:
+                    probeMarks[m.probeID] = max(m.timestamp, probeMarks.get(m.probeID, -1))
+                if saveHighWaterMarks(highWaterMarks) is None:
+                    return None
+    finally:
+        writer.close()
+
+    if failedUDMs:
+        print('error: Could not get the results of ' + str(len(failedUDMs)) + ' measurement(s) out of '
+              + str(len(udms)) + ': ' + ' '.join(map(str, failedUDMs)) + '\n')
+    return failedUDMs
+
+
+def analyse_traceroute_dump(filename, verbose, batchSize=DUMP_BATCH_SIZE, recordFormat=FORMAT_TEXT, compression=None):
+    """
+    Parses the traceroute-results stored in the local dump <filename> instead of downloading them, and writes them to
+    file '../output/<timestamp>_scheduled_traceroutes.txt'. The dump is read incrementally, so that its size is not
+    limited by the available memory
+    :param filename:    the name of the dump (JSON array or NDJSON, possibly compressed with gzip or bzip2)
+    :param verbose:     if true, the progress will be written to the standard-output
+    :param batchSize:   the number of results mapped to ASes and saved at once
+    :param recordFormat: the format of the records in the output file (see TracerouteWriter)
+    :param compression: None, 'gzip' or 'zstd'
+    :return:            the number of saved traceroutes; None if a problem occurred
+    """
+    if parseIP.loadIPtoASIndex('../lib/GeoIPASNum2.csv', verbose) is None:
+        return None
 
     currentTime = datetime.datetime.fromtimestamp(time.time()).strftime('%Y-%m-%d-%H-%M-%S')
-    for measurement in measurementsToAnalyse:
-        measurement.saveToFile(IPToASMapping, currentTime)
-    udmFile.close()
+    writer = TracerouteWriter(currentTime, recordFormat, compression)
+    if writer.open() is None:
+        return None
+
+    resetIPTable()
+    nbSaved = 0
+    batch = []
+    try:
+        for result in dump.iterResults(filename, ('traceroute',), True):
+            if result is None:
+                return None
+
+            batch.append(result)
+            if len(batch) >= batchSize:
+                saved = saveTracerouteResults(batch, writer, verbose)
+                if saved is None:
+                    return None
+                nbSaved += len(saved)
+                batch = []
+                resetIPTable()  # the saved measurements are not kept
+
+        saved = saveTracerouteResults(batch, writer, verbose)
+        if saved is None:
+            return None
+        return nbSaved + len(saved)
+    finally:
+        writer.close()
 
 
 if __name__ == '__main__':
@@ -285,15 +939,75 @@ if __name__ == '__main__':
 
     parser.add_argument('-v', action="version", version="version 1.0")
     parser.add_argument('-n', action="store", dest="filename", help="name of the file the measurement IDs are stored in")
+    parser.add_argument('-d', action="store", dest="dump", help="Local dump of traceroute-results (JSON array or one "
+                                                                "result per line, possibly compressed with gzip or "
+                                                                "bzip2) to analyse instead of downloading the results "
+                                                                "of the measurements listed in the file given with -n")
+    parser.add_argument('-w', action="store", dest="nbWorkers", type=int, default=NB_WORKERS_DEFAULT,
+                        help="Number of measurements whose results are downloaded concurrently (default: "
+                             + str(NB_WORKERS_DEFAULT) + ")")
+    parser.add_argument('-a', action="store", dest="resultCache", type=int, choices=[0, 1], default=1,
+                        help="1 (default) if the downloaded results should be kept in the local result cache "
+                             "'logs/results_cache' and read from it when available, 0 otherwise")
+    parser.add_argument('--http2', action="store", dest="http2", type=int, choices=[0, 1], default=0,
+                        help="1 if the requests to the RIPE Atlas API should be sent over HTTP/2 (requires the "
+                             "'httpx' package), 0 for HTTP/1.1 keep-alive connections (default)")
+    parser.add_argument('-o', action="store", dest="format", choices=[FORMAT_TEXT, FORMAT_JSONL, FORMAT_CSV],
+                        default=FORMAT_TEXT, help="Format of the records in the output file (default: "
+                                                  + FORMAT_TEXT + ")")
+    parser.add_argument('-z', action="store", dest="compression", choices=['gzip', 'zstd'],
+                        help="Compress the output file with gzip or zstd (zstd requires the 'zstandard' package)")
+    parser.add_argument('-p', action="store", dest="pops", type=int, choices=[0, 1], default=1,
+                        help="1 (default) to map the router interfaces to PoPs through 'lib/ip_to_pop_mapping.txt', "
+                             "0 to skip the PoP lookups (the PoP hops are then NA)")
+    parser.add_argument('-l', action="store", dest="aliases", type=int, choices=[0, 1], default=0,
+                        help="1 to group the router interfaces listed in 'lib/alias_lists.txt' by router: their AS "
+                             "and PoP are looked up once per router and a ROUTERPATH line is added to the output, "
+                             "0 otherwise (default)")
+    parser.add_argument('-f', action="store", dest="follow", type=int, choices=[0, 1], default=0,
+                        help="1 to enable the follow-mode: only the results obtained since the previous run are "
+                             "downloaded and appended to 'output/<UDM filename>_scheduled_traceroutes.txt', 0 otherwise")
+    parser.add_argument('-i', action="store", dest="period", type=int, default=0,
+                        help="In follow-mode, if > 0, the new results are downloaded every <period> seconds until "
+                             "the script is interrupted (default: 0, the results are downloaded once)")
 
     arguments = vars(parser.parse_args())
 
-    if not any(arguments.values()):
-        parser.error('You must specify the filename containing measurement IDs!')
+    if not arguments['filename'] and not arguments['dump']:
+        parser.error('You must specify the filename containing measurement IDs or a dump of results!')
+        exit(1)
+
+    rc.configureCache(enabled=arguments['resultCache'] == 1)
+    if ac.configureClient(http2=arguments['http2'] == 1) is None:
         exit(1)
 
-    if loadIPToPoPMapping('../lib/ip_to_pop_mapping.txt') is None:
+    if arguments['pops'] == 1:
+        if loadIPToPoPMapping('../lib/ip_to_pop_mapping.txt') is None:
+            exit(2)
+    else:  # the PoP-file is not used at all
+        IPToPoPIndex = False
+    if arguments['aliases'] == 1 and loadAliasLists('../lib/alias_lists.txt') is None:
         exit(2)
 
-    retrieve_traceroute_results('../input/' + arguments["filename"], True)
+    if arguments['dump']:
+        nbSaved = analyse_traceroute_dump(arguments['dump'], True, recordFormat=arguments['format'],
+                                          compression=arguments['compression'])
+        print('AS-path segments: ' + str(ASPathSegments.hits) + ' cache hits, ' + str(ASPathSegments.misses)
+              + ' RouteViews lookups\n')
+        exit(3 if nbSaved is None else 0)
+
+    while True:
+        failedUDMs = retrieve_traceroute_results('../input/' + arguments["filename"], True,
+                                                 max(1, arguments['nbWorkers']), arguments['follow'] == 1,
+                                                 arguments['format'], arguments['compression'])
+        if failedUDMs is None:
+            exit(3)
+        print('AS-path segments: ' + str(ASPathSegments.hits) + ' cache hits, ' + str(ASPathSegments.misses)
+              + ' RouteViews lookups\n')
+        if arguments['follow'] != 1 or arguments['period'] <= 0:
+            break
+        time.sleep(arguments['period'])
+
+    if failedUDMs:
+        exit(4)
 
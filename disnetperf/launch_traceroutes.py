@@ -17,9 +17,13 @@ import argparse
 import datetime
 import time
 import math
-from ripe.atlas.cousteau import Traceroute, AtlasSource, AtlasCreateRequest
+from multiprocessing.pool import ThreadPool
+from functools import partial
+from ripe.atlas.cousteau import Traceroute, AtlasSource
 
 import disnetperf.find_psbox as ps
+import disnetperf.AUX_atlas_client as ac
+import disnetperf.AUX_request_scheduler as rs
 
 
 # global vars - begin
@@ -27,6 +31,72 @@ INTERVAL_DEFAULT = 600
 # global vars - end
 
 
+def createTracerouteMeasurements(destIP, probes, start, stop, interval, numberOfTraceroutes):
+    """
+    Creates the traceroute measurements from the probes <probes> to <destIP> (one measurement per 500 probes).
+    For the meaning of the parameters, please see launch_scheduled_traceroutes
+    :return:    the list of the IDs of the created measurements; None if a measurement could not be created
+    """
+    measurementIDs = []
+
+    probes = [int(p) for p in probes]
+    probes = [probes[i:i + 500] for i in range(0, len(probes), 500)]
+    for probesToUse in probes:
+        nProbesToUse = len(probesToUse)
+        probesToUse = ','.join(map(str, probesToUse))
+
+        # Create a request depending on the requested parameters.
+        if stop:
+            startTime = start if start else int(math.ceil(time.time())) + 1
+            i = interval if interval else INTERVAL_DEFAULT
+
+            description = "Traceroute target={target} [{start}:{stop}]".format(target=destIP, start=startTime, 
+                                                                               stop=stop)
+            traceroute = Traceroute(af=4, target=destIP, description=description, protocol="ICMP")
+            source = AtlasSource(type="probes", value=probesToUse, requested=nProbesToUse)
+            request = partial(ac.createMeasurements, API_KEY, [traceroute], [source], is_oneoff=False,
+                              start_time=startTime, stop_time=stop, interval=i)
+
+        elif not start and not interval and not numberOfTraceroutes:
+            description = "Traceroute target={target}".format(target=destIP)
+            traceroute = Traceroute(af=4, target=destIP, description=description, protocol="ICMP")
+            source = AtlasSource(type="probes", value=probesToUse, requested=nProbesToUse)
+            request = partial(ac.createMeasurements, API_KEY, [traceroute], [source], is_oneoff=True)
+
+        elif numberOfTraceroutes and interval and not start:
+            startTime = int(math.ceil(time.time())) + 1
+            stopTime = startTime + numberOfTraceroutes * interval
+
+            description = "Traceroute target={target} [{start}:{stop}]".format(target=destIP, start=startTime, 
+                                                                               stop=stopTime)
+            traceroute = Traceroute(af=4, target=destIP, description=description, protocol="ICMP")
+            source = AtlasSource(type="probes", value=probesToUse, requested=nProbesToUse)
+            request = partial(ac.createMeasurements, API_KEY, [traceroute], [source], is_oneoff=False,
+                              start_time=startTime, stop_time=stopTime, interval=interval)
+
+        elif numberOfTraceroutes and not interval:
+            startTime = start if start else int(math.ceil(time.time())) + 1
+            stopTime = startTime + numberOfTraceroutes * INTERVAL_DEFAULT
+
+            description = "Traceroute target={target} [{start}:{stop}]".format(target=destIP, start=startTime, 
+                                                                               stop=stopTime)
+            traceroute = Traceroute(af=4, target=destIP, description=description, protocol="ICMP")
+            source = AtlasSource(type="probes", value=probesToUse, requested=nProbesToUse)
+            request = partial(ac.createMeasurements, API_KEY, [traceroute], [source], is_oneoff=False,
+                              start_time=startTime, stop_time=stopTime, interval=INTERVAL_DEFAULT)
+
+        else:
+            continue
+
+        # Actually start the request; the shared request scheduler retries it when it fails.
+        (is_success, response) = rs.getScheduler().create(request)
+        if not is_success or 'measurements' not in response:
+            return None
+        measurementIDs += response['measurements']
+
+    return measurementIDs
+
+
 def launch_scheduled_traceroutes(destIP, probes, start, stop, interval, numberOfTraceroutes):
     """
     Launches traceroutes.
@@ -50,76 +120,76 @@ def launch_scheduled_traceroutes(destIP, probes, start, stop, interval, numberOf
         print("error: Could not open/create '../logs/" + currentTime + "_current_scheduled_traceroutes.log'!\n")
         return
 
-    giveUp = False
-    measurementIDs = []
+    measurementIDs = createTracerouteMeasurements(destIP, probes, start, stop, interval, numberOfTraceroutes)
+    if measurementIDs is not None:
+        logFile.write('\t'.join(map(str, measurementIDs)) + '\t' + destIP + '\n')
+    logFile.close()
 
-    probes = [int(p) for p in probes]
-    probes = [probes[i:i + 500] for i in range(0, len(probes), 500)]
-    for probesToUse in probes:
-        nProbesToUse = len(probesToUse)
-        probesToUse = ','.join(map(str, probesToUse))
 
-        for _ in range(5):  # Perform at most 5 tries before giving up.
-            # Create a request depending on the requested parameters.
-            if stop:
-                startTime = start if start else int(math.ceil(time.time())) + 1
-                i = interval if interval else INTERVAL_DEFAULT
-
-                description = "Traceroute target={target} [{start}:{stop}]".format(target=destIP, start=startTime, 
-                                                                                   stop=stop)
-                traceroute = Traceroute(af=4, target=destIP, description=description, protocol="ICMP")
-                source = AtlasSource(type="probes", value=probesToUse, requested=nProbesToUse)
-                request = AtlasCreateRequest(start_time=startTime, stop_time=stop, key=API_KEY,
-                                             measurements=[traceroute], sources=[source], is_oneoff=False, interval=i)
-
-            elif not start and not interval and not numberOfTraceroutes:
-                description = "Traceroute target={target}".format(target=destIP)
-                traceroute = Traceroute(af=4, target=destIP, description=description, protocol="ICMP")
-                source = AtlasSource(type="probes", value=probesToUse, requested=nProbesToUse)
-                request = AtlasCreateRequest(key=API_KEY, measurements=[traceroute], sources=[source], is_oneoff=True)
-
-            elif numberOfTraceroutes and interval and not start:
-                startTime = int(math.ceil(time.time())) + 1
-                stopTime = startTime + numberOfTraceroutes * interval
-
-                description = "Traceroute target={target} [{start}:{stop}]".format(target=destIP, start=startTime, 
-                                                                                   stop=stopTime)
-                traceroute = Traceroute(af=4, target=destIP, description=description, protocol="ICMP")
-                source = AtlasSource(type="probes", value=probesToUse, requested=nProbesToUse)
-                request = AtlasCreateRequest(start_time=startTime, stop_time=stopTime, key=API_KEY, 
-                                             measurements=[traceroute], sources=[source], is_oneoff=False, 
-                                             interval=interval)
-
-            elif numberOfTraceroutes and not interval:
-                startTime = start if start else int(math.ceil(time.time())) + 1
-                stopTime = startTime + numberOfTraceroutes * INTERVAL_DEFAULT
-
-                description = "Traceroute target={target} [{start}:{stop}]".format(target=destIP, start=startTime, 
-                                                                                   stop=stopTime)
-                traceroute = Traceroute(af=4, target=destIP, description=description, protocol="ICMP")
-                source = AtlasSource(type="probes", value=probesToUse, requested=nProbesToUse)
-                request = AtlasCreateRequest(start_time=startTime, stop_time=stopTime, key=API_KEY, 
-                                             measurements=[traceroute], sources=[source], is_oneoff=False, 
-                                             interval=INTERVAL_DEFAULT)
+def launch_pipelined_traceroutes(targetIPs, destIP, start, stop, interval, numberOfTraceroutes, nbWorkers, cacheTTL=0,
+                                 cacheFallback=ps.pcache.FALLBACK_NONE):
+    """
+    Locates the closest boxes to the IPs <targetIPs> and launches traceroutes from each box as soon as it is known,
+    instead of waiting for the closest boxes to all the IPs. At most <nbWorkers> boxes are being launched from at the
+    same time. A line is written to the log-file for every box the traceroutes could be launched from.
+    For the meaning of the other parameters, please see launch_scheduled_traceroutes
+    :param targetIPs:   the IPs whose closest boxes should be used as sources
+    :param nbWorkers:   the maximum number of traceroute-launches in flight
+    :param cacheTTL:    if > 0, closest boxes found less than <cacheTTL> seconds ago are taken from the closest-box cache
+                        (see find_psbox.iter_psboxes)
+    :param cacheFallback: which cache entries may be used for an IP (see find_psbox.iter_psboxes)
+    :return:            the list of the boxes the traceroutes could not be launched from (empty if they could be launched
+                        from every box); None if the closest boxes could not be located
+    """
+    currentTime = datetime.datetime.fromtimestamp(time.time()).strftime('%Y-%m-%d-%H-%M-%S')
+    try:
+        logFile = open('../logs/' + currentTime + '_current_scheduled_traceroutes.log', 'w', 1)
+    except IOError:
+        print("error: Could not open/create '../logs/" + currentTime + "_current_scheduled_traceroutes.log'!\n")
+        return None
 
-            else:
-                break
+    def launchTraceroutes(closestBox):  # runs in a worker of the pool; never raises, so that every launch is reported
+        try:
+            return closestBox, createTracerouteMeasurements(destIP, [closestBox], start, stop, interval,
+                                                            numberOfTraceroutes)
+        except Exception:
+            return closestBox, None
 
-            # Actually start the request.
-            (is_success, response) = request.create()
-            if is_success and 'measurements' in response:
-                measurementIDs += response['measurements']
-                break
-            else:
-                time.sleep(180)
+    def traceroutesLaunched(result):  # runs in the pool's result-handler thread, one call at a time
+        closestBox, measurementIDs = result
+        if measurementIDs is None:
+            print('error: Could not launch the traceroutes from box ' + str(closestBox) + '\n')
+            failedBoxes.append(closestBox)
         else:
-            giveUp = True
+            logFile.write('\t'.join(map(str, measurementIDs)) + '\t' + destIP + '\n')
+
+    pool = ThreadPool(max(1, nbWorkers))
+    boxesUsed = set()
+    failedBoxes = []
+    status = True
+
+    for result in ps.iter_psboxes(targetIPs, True, cacheTTL=cacheTTL, cacheFallback=cacheFallback):
+        if result is None:
+            status = None
             break
 
-    if not giveUp:
-        logFile.write('\t'.join(map(str, measurementIDs)) + '\t' + destIP + '\n')
+        closestBox = result[1][0]
+        if closestBox in boxesUsed:
+            continue
+        boxesUsed.add(closestBox)
+        pool.apply_async(launchTraceroutes, (closestBox,), callback=traceroutesLaunched)
+
+    pool.close()
+    pool.join()
     logFile.close()
 
+    if status is None:
+        return None
+    if failedBoxes:
+        print('error: Could not launch the traceroutes from ' + str(len(failedBoxes)) + ' box(es) out of '
+              + str(len(boxesUsed)) + ': ' + ' '.join(map(str, failedBoxes)) + '\n')
+    return failedBoxes
+
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Launch traceroutes from the closest RIPE Atlas boxes'
@@ -144,6 +214,19 @@ if __name__ == '__main__':
     parser.add_argument('-t', action="store", dest="interval", type=int, help="Time between two consecutive traceroutes (in seconds)")
     parser.add_argument('-s', action="store", dest="start", type=int, help="Time when the first traceroute should be launched")
     parser.add_argument('-p', action="store", dest="stop", type=int, help="Time when traceroutes should be stopped")
+    parser.add_argument('-w', action="store", dest="pipeline", type=int, default=0,
+                        help="If > 0 and -f is 0, the traceroutes from a closest box are launched as soon as this box is "
+                             "known, with at most this number of launches in flight. If 0 (default), the traceroutes are "
+                             "launched once the closest boxes to all the IPs are known")
+    parser.add_argument('-c', action="store", dest="cacheTTL", type=int, default=0,
+                        help="Only used when -f is 0. If > 0, closest boxes found less than this number of seconds ago "
+                             "are taken from the closest-box cache instead of being measured again (default: 0)")
+    parser.add_argument('-x', action="store", dest="cacheFallback", type=int, choices=[0, 1, 2], default=0,
+                        help="Cache entries that may be used for an IP: 0 for the same IP only, 1 to also use an IP of "
+                             "the same covering prefix and AS, 2 to also use any IP of the same AS")
+    parser.add_argument('--http2', action="store", dest="http2", type=int, choices=[0, 1], default=0,
+                        help="1 if the requests to the RIPE Atlas API should be sent over HTTP/2 (requires the "
+                             "'httpx' package), 0 for HTTP/1.1 keep-alive connections (default)")
 
     arguments = vars(parser.parse_args())
 
@@ -170,7 +253,10 @@ if __name__ == '__main__':
     # check parameters - end
 
     API_KEY = arguments['api-key']
+    ps.API_KEY = API_KEY
     flag = arguments['flag']
+    if ac.configureClient(http2=arguments['http2'] == 1) is None:
+        exit(1)
 
     # when the user indicated an IP (-o), always go for it (and ignore file passed via -n)
     if arguments['targetIP']:
@@ -178,9 +264,10 @@ if __name__ == '__main__':
             closestBox = str(arguments['boxID'])
         else:
             targetIP = arguments['targetIP']
-            closestBoxMap = ps.find_psboxes([targetIP], True)
+            closestBoxMap = ps.find_psboxes([targetIP], True, cacheTTL=arguments['cacheTTL'],
+                                            cacheFallback=arguments['cacheFallback'])
             if closestBoxMap:
-                closestBox = closestBoxMap[targetIP]
+                closestBox = closestBoxMap[targetIP][0]
             elif closestBoxMap is None:
                 exit(3)
             else:
@@ -210,8 +297,19 @@ if __name__ == '__main__':
             print("error: Could not open file '../input/" + arguments['filename'] + "'\n")
             exit(2)
 
-        if flag == 0:
-            closestBoxMap = ps.find_psboxes(targetIPs, True, False)
+        if flag == 0 and arguments['pipeline'] > 0:
+            failedBoxes = launch_pipelined_traceroutes(targetIPs, arguments['destIP'], arguments['start'],
+                                                       arguments['stop'], arguments['interval'],
+                                                       arguments['nbTraceroutes'], arguments['pipeline'],
+                                                       arguments['cacheTTL'], arguments['cacheFallback'])
+            if failedBoxes is None:
+                exit(3)
+            if failedBoxes:
+                exit(4)
+            exit(0)
+        elif flag == 0:
+            closestBoxMap = ps.find_psboxes(targetIPs, True, False, cacheTTL=arguments['cacheTTL'],
+                                            cacheFallback=arguments['cacheFallback'])
             if closestBoxMap:
                 for key in closestBoxMap:
                     closestBox.add(closestBoxMap[key][0])